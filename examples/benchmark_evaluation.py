@@ -0,0 +1,108 @@
+"""Compare serial and parallel evaluation of a wide graph.
+
+    $ python examples/benchmark_evaluation.py
+
+The graph has independent chains of Nodes, all fed by one Source and
+collected by one Sum. It is evaluated twice: with Nodes that wait (like
+I/O, which releases the GIL, so threads suffice) and with Nodes that
+burn CPU in pure Python (which opt into worker processes).
+"""
+
+import os
+import sys
+import time
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from qtnodes.model import GraphModel  # noqa
+from qtnodes.evaluation import Evaluator  # noqa
+from qtnodes.executor import ParallelEvaluator  # noqa
+
+
+WIDTH = 16
+DEPTH = 4
+
+
+class Source(object):
+
+    @staticmethod
+    def compute(inputs, params):
+        return {"value": params.get("value", 1)}
+
+
+class Wait(object):
+
+    @staticmethod
+    def compute(inputs, params):
+        time.sleep(0.02)
+        return {"value": inputs["x"] + 1}
+
+
+class Burn(object):
+
+    computeInProcess = True
+
+    @staticmethod
+    def compute(inputs, params):
+        value = inputs["x"]
+        for i in range(200000):
+            value = (value * 31 + i) % 1000003
+        return {"value": value}
+
+
+class Sum(object):
+
+    @staticmethod
+    def compute(inputs, params):
+        return {"value": sum(inputs["x"])}
+
+
+def buildModel(cls):
+    model = GraphModel()
+    source = model.addNode("source", "Source", outputs=["value"])
+    total = model.addNode("sum", "Sum", inputs=["x"], outputs=["value"])
+    for chain in range(WIDTH):
+        previous = source
+        for step in range(DEPTH):
+            node = model.addNode("{0}-{1}".format(chain, step), cls.__name__,
+                                 inputs=["x"], outputs=["value"])
+            model.addEdge(previous, "value", node, "x")
+            previous = node
+        model.addEdge(previous, "value", total, "x")
+    return model, source, total
+
+
+def run(evaluatorClass, cls, **kwargs):
+    model, source, total = buildModel(cls)
+    evaluator = evaluatorClass(model, [Source, Sum, cls], **kwargs)
+    # Start the pools outside of the measurement.
+    evaluator.evaluate(source)
+
+    start = time.time()
+    result = evaluator.value(total, "value")
+    elapsed = time.time() - start
+
+    # Only the downstream cone is computed again.
+    evaluator.setParameter(source, "value", 2)
+    evaluator.value(total, "value")
+
+    if hasattr(evaluatorClass, "close"):
+        evaluator.close()
+    return result, elapsed
+
+
+def main():
+    print("{0} chains of {1} Nodes, {2} CPUs\n".format(
+        WIDTH, DEPTH, multiprocessing.cpu_count()))
+    for cls in (Wait, Burn):
+        serialResult, serial = run(Evaluator, cls)
+        # Waiting does not take a CPU, so use a thread per chain.
+        parallelResult, parallel = run(ParallelEvaluator, cls, threads=WIDTH)
+        assert parallelResult == serialResult
+        print("{0}: serial {1:.2f}s, parallel {2:.2f}s ({3:.1f}x)".format(
+            cls.__name__, serial, parallel, serial / parallel))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,19 @@
 """Users should import from here."""
 
-from qtnodes.header import Header
-from qtnodes.node import Node
-from qtnodes.knob import InputKnob, OutputKnob
+from qtnodes.model import GraphModel
+from qtnodes.evaluation import Evaluator
+from qtnodes.executor import ParallelEvaluator
+from qtnodes.compiler import Compiler
+from qtnodes.batch import evaluateBatch
 
-from qtnodes.widget import NodeGraphWidget
+try:
+    import PySide  # noqa
+except ImportError:
+    # Without Qt, only the model and its evaluation can be used.
+    pass
+else:
+    from qtnodes.header import Header
+    from qtnodes.node import Node
+    from qtnodes.knob import InputKnob, OutputKnob
+
+    from qtnodes.widget import NodeGraphWidget
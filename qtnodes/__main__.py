@@ -10,24 +10,41 @@ from .widget import NodeGraphWidget
 
 class Integer(Node):
 
+    batchParameter = "value"
+    batchType = "int64"
+
     def __init__(self, *args, **kwargs):
         super(Integer, self).__init__(*args, **kwargs)
         self.addHeader(Header(node=self, text="Int"))
         self.addKnob(OutputKnob(name="value"))
         # self.header.fillColor = QtGui.QColor(36, 128, 18)
 
+    @staticmethod
+    def compute(inputs, params):
+        return {"value": int(params.get("value", 0))}
+
 
 class Float(Node):
 
+    batchParameter = "value"
+    batchType = "float64"
+
     def __init__(self, *args, **kwargs):
         super(Float, self).__init__(*args, **kwargs)
         self.addHeader(Header(node=self, text="Float"))
         self.addKnob(OutputKnob(name="value"))
         # self.header.fillColor = QtGui.QColor(24, 129, 163)
 
+    @staticmethod
+    def compute(inputs, params):
+        return {"value": float(params.get("value", 0.0))}
+
 
 class Multiply(Node):
 
+    ufunc = "multiply"
+    ufuncInputs = (("x", 1), ("y", 1))
+
     def __init__(self, *args, **kwargs):
         super(Multiply, self).__init__(*args, **kwargs)
         self.addHeader(Header(node=self, text=self.__class__.__name__))
@@ -36,30 +53,57 @@ class Multiply(Node):
         self.addKnob(OutputKnob(name="value"))
         # self.header.fillColor = QtGui.QColor(163, 26, 159)
 
+    @staticmethod
+    def compute(inputs, params):
+        return {"value": inputs.get("x", 1) * inputs.get("y", 1)}
+
 
 class Divide(Multiply):
 
+    ufunc = "true_divide"
+
     def __init__(self, *args, **kwargs):
         super(Divide, self).__init__(*args, **kwargs)
         # self.header.fillColor = QtGui.QColor(26, 163, 159)
 
+    @staticmethod
+    def compute(inputs, params):
+        return {"value": inputs.get("x", 1) / inputs.get("y", 1)}
+
 
 class Add(Multiply):
 
+    ufunc = "add"
+    ufuncInputs = (("x", 0), ("y", 0))
+
     def __init__(self, *args, **kwargs):
         super(Add, self).__init__(*args, **kwargs)
         # self.header.fillColor = QtGui.QColor(105, 128, 23)
 
+    @staticmethod
+    def compute(inputs, params):
+        return {"value": inputs.get("x", 0) + inputs.get("y", 0)}
+
 
 class Subtract(Multiply):
 
+    ufunc = "subtract"
+    ufuncInputs = (("x", 0), ("y", 0))
+
     def __init__(self, *args, **kwargs):
         super(Subtract, self).__init__(*args, **kwargs)
         # self.header.fillColor = QtGui.QColor(23, 51, 128)
 
+    @staticmethod
+    def compute(inputs, params):
+        return {"value": inputs.get("x", 0) - inputs.get("y", 0)}
+
 
 class Output(Node):
 
+    ufunc = "positive"
+    ufuncInputs = (("output", None),)
+
     def __init__(self, *args, **kwargs):
         super(Output, self).__init__(*args, **kwargs)
         self.addHeader(Header(node=self, text="Output"))
@@ -67,6 +111,11 @@ class Output(Node):
         # self.header.fillColor = self.fillColor
         # self.header.textColor = QtGui.QColor(10, 10, 10)
 
+    @staticmethod
+    def compute(inputs, params):
+        # Not exposed as Knob, but handy to read the result.
+        return {"value": inputs.get("output")}
+
 
 class BigNode(Node):
 
@@ -138,11 +187,13 @@ def test():
     graph.registerNodeClass(Directory)
     graph.registerNodeClass(MaxObject)
 
-    nodeInt1 = Integer(scene=graph.scene)
-    nodeInt2 = Integer(scene=graph.scene)
-    nodeMult = Multiply(scene=graph.scene)
-    nodeOut = Output(scene=graph.scene)
-    nodeBig = BigNode(scene=graph.scene)
+    nodeInt1 = Integer()
+    nodeInt2 = Integer()
+    nodeMult = Multiply()
+    nodeOut = Output()
+    nodeBig = BigNode()
+    for node in (nodeInt1, nodeInt2, nodeMult, nodeOut, nodeBig):
+        graph.addNode(node)
 
     nodeInt2.moveBy(100, 250)
     nodeMult.moveBy(200, 100)
@@ -152,6 +203,11 @@ def test():
     nodeInt1.knob("value").connectTo(nodeMult.knob("x"))
     nodeInt2.knob("value").connectTo(nodeMult.knob("y"))
 
+    graph.evaluator.setParameter(nodeInt1.record, "value", 6)
+    graph.evaluator.setParameter(nodeInt2.record, "value", 7)
+    print("Multiply: {0}".format(
+        graph.evaluator.value(nodeMult.record, "value")))
+
     nodeMult.knob("value").connectTo(nodeBig.knob("i1"))
     nodeMult.knob("value").connectTo(nodeBig.knob("i2"))
     nodeMult.knob("value").connectTo(nodeBig.knob("i3"))
@@ -182,13 +238,11 @@ if __name__ == '__main__':
 """
 todos
 
-- bug: sometimes a node's background rectangle is not cleared when deleting nodes
-
 - make graphviz layouting aware of actual node width and height
 - decouple identifier and display name in all items, so it can be changed
 - edit nodes: possibly like in nuke, with an extra floating widget or a sidebar
 - attach data to nodes and let them modify it: callbacks? custom signals?
-- evaluate the graph, graph traversal, show some values in the ui?
+- show some values in the ui?
 - global settings, like 'restrict user from editing Edges'
 - tests!
 
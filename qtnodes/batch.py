@@ -0,0 +1,218 @@
+"""Evaluate elementwise graphs on NumPy arrays, a whole batch at once.
+
+Arithmetic Nodes compute every row of a batch the same way, so instead
+of calling their compute functions once per row, the graph is run on
+arrays. A node class takes part by naming the NumPy ufunc it applies to
+its inputs:
+
+    class Multiply(Node):
+
+        ufunc = "multiply"
+        # Knob names in the order the ufunc takes them, and the value to
+        # use if the Knob is not connected.
+        ufuncInputs = (("x", 1), ("y", 1))
+
+Source Nodes instead name the parameter they output and its dtype:
+
+    class Integer(Node):
+
+        batchParameter = "value"
+        batchType = "int64"
+
+A source's parameter may be one value for all rows or an array with a
+value per row.
+
+The rows are processed in blocks of BLOCK_SIZE, small enough for the
+CPU caches. Each ufunc writes to an `out=` buffer that is reused as soon
+as its value is no longer needed, often in place along a chain of Nodes,
+so there is no temporary array per Node and nothing is allocated per
+block.
+
+NumPy is an optional dependency, only needed for this.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .evaluation import upstreamOrder, classMap, lookupNodeClass
+from .exceptions import EvaluationError, MissingDependencyError
+
+
+BLOCK_SIZE = 1 << 16
+
+
+def evaluateBatch(model, nodeClasses, parameters=None, outputs=None,
+                  blockSize=BLOCK_SIZE):
+    """Return the values of the requested Nodes as {uuid: array}.
+
+    parameters are given as {uuid: params}, the same as for a compiled
+    graph (see compiler.py), with arrays of equal length for the rows
+    of the batch. outputs are the uuids of the Nodes to return, by
+    default all Nodes without outgoing Edges.
+    """
+    if numpy is None:
+        raise MissingDependencyError("Batch evaluation needs numpy.")
+
+    if outputs is None:
+        outputs = [node.uuid for node in model.nodes()
+                   if not model.outEdges(node)]
+    nodes = [model.node(uuid) for uuid in outputs]
+    if None in nodes:
+        raise EvaluationError("Can only evaluate Nodes that are part of "
+                              "the model.")
+    order = upstreamOrder(model, [node.id for node in nodes])
+    classes = classMap(nodeClasses)
+    parameters = parameters or {}
+
+    steps = []
+    dtypes = {}  # Node id -> dtype of its values.
+    for nodeId in order:
+        node = model.nodeById(nodeId)
+        step = _Step(model, node, _batchClass(node, classes),
+                     parameters.get(node.uuid, {}), dtypes)
+        dtypes[nodeId] = step.dtype
+        steps.append(step)
+
+    rows = set(len(step.value) for step in steps
+               if step.value is not None and step.value.ndim)
+    if len(rows) > 1:
+        raise EvaluationError("All parameter arrays must have the same "
+                              "length, not {0}.".format(sorted(rows)))
+    numRows = rows.pop() if rows else 1
+
+    results = dict((node.id, numpy.empty(numRows, dtypes[node.id]))
+                   for node in nodes)
+    _assignBuffers(steps, results, min(blockSize, numRows))
+
+    for start in range(0, numRows, blockSize):
+        stop = min(start + blockSize, numRows)
+        values = {}  # Node id -> value in this block.
+        for step in steps:
+            values[step.nodeId] = step.run(values, results, start, stop)
+
+    return dict((node.uuid, results[node.id]) for node in nodes)
+
+
+def _batchClass(node, classes):
+    cls = lookupNodeClass(node, classes)
+    if (getattr(cls, "ufunc", None) is None and
+            getattr(cls, "batchParameter", None) is None):
+        raise EvaluationError(
+            "Node class {0} can not be evaluated in batches.".format(
+                node.cls))
+    return cls
+
+
+class _Step(object):
+    """Computing one Node's values for a block of rows."""
+
+    def __init__(self, model, node, cls, params, dtypes):
+        self.nodeId = node.id
+        self.buffer = None  # Assigned by _assignBuffers(), if needed.
+
+        ufunc = getattr(cls, "ufunc", None)
+        if ufunc is None:
+            # A source, with one value or an array of them.
+            self.ufunc = None
+            self.args = []
+            self.dtype = numpy.dtype(cls.batchType)
+            self.value = numpy.asarray(params.get(cls.batchParameter, 0))
+            if self.value.ndim > 1:
+                raise EvaluationError(
+                    "Parameter {0} of {1} must be one value or an array "
+                    "of them.".format(cls.batchParameter, node))
+            if not self.value.ndim:
+                self.value = self.dtype.type(self.value)
+            return
+
+        self.ufunc = getattr(numpy, ufunc)
+        self.value = None
+        # A Node id for each connected input, the value otherwise.
+        self.args = []
+        for name, default in cls.ufuncInputs:
+            edges = [e for e in model.inEdges(node) if e.targetKnob == name]
+            if len(edges) > 1:
+                raise EvaluationError(
+                    "Input {0} of {1} can only have one Edge.".format(
+                        name, node))
+            if edges:
+                self.args.append(_Input(edges[0].source))
+            elif default is None:
+                raise EvaluationError(
+                    "Input {0} of {1} must be connected.".format(name, node))
+            else:
+                self.args.append(default)
+
+        # Let NumPy tell the resulting type.
+        samples = [numpy.ones(1, dtypes[arg.nodeId])
+                   if isinstance(arg, _Input) else arg for arg in self.args]
+        with numpy.errstate(all="ignore"):
+            self.dtype = self.ufunc(*samples).dtype
+
+    def needsBuffer(self):
+        if self.ufunc is not None:
+            return True
+        # Arrays of another type are converted.
+        return self.value.ndim == 1 and self.value.dtype != self.dtype
+
+    def run(self, values, results, start, stop):
+        if self.nodeId in results:
+            out = results[self.nodeId][start:stop]
+        elif self.buffer is not None:
+            out = self.buffer[:stop - start]
+        else:
+            out = None
+
+        if self.ufunc is None:
+            value = self.value
+            if value.ndim:
+                value = value[start:stop]
+            if out is None:
+                return value
+            out[...] = value
+            return out
+
+        args = [values[arg.nodeId] if isinstance(arg, _Input) else arg
+                for arg in self.args]
+        return self.ufunc(*args, out=out)
+
+
+class _Input(object):
+    """A ufunc argument that is the value of another Node."""
+
+    __slots__ = ("nodeId",)
+
+    def __init__(self, nodeId):
+        self.nodeId = nodeId
+
+
+def _assignBuffers(steps, results, size):
+    """Give each Step that needs one a buffer, reusing those of values
+    that are not needed anymore."""
+    lastUse = {}
+    for position, step in enumerate(steps):
+        for arg in step.args:
+            if isinstance(arg, _Input):
+                lastUse[arg.nodeId] = position
+
+    owners = {}  # Node id -> its buffer, until its last use.
+    free = {}  # dtype -> buffers.
+    for position, step in enumerate(steps):
+        # The inputs may be overwritten by this Node already, the ufuncs
+        # work elementwise.
+        for arg in step.args:
+            if (isinstance(arg, _Input) and arg.nodeId in owners and
+                    lastUse[arg.nodeId] == position):
+                buffer = owners.pop(arg.nodeId)
+                free.setdefault(buffer.dtype, []).append(buffer)
+
+        if step.nodeId in results or not step.needsBuffer():
+            continue
+        available = free.get(step.dtype)
+        if available:
+            step.buffer = available.pop()
+        else:
+            step.buffer = numpy.empty(size, step.dtype)
+        owners[step.nodeId] = step.buffer
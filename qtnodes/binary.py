@@ -0,0 +1,165 @@
+"""Compact binary scene format.
+
+Same content as the .json scene files, but laid out as tables:
+
+    magic       b"QTNB"
+    header      version, index width, #classes, #knob names, #nodes, #edges
+    strings     class names, then knob names (length prefixed utf-8)
+    nodes       class indices, uuids (16 raw bytes each), x array, y array
+    edges       (source node, source knob, target node, target knob)
+                index quadruples into the node and knob name tables
+
+All numbers are little-endian, positions are stored as doubles.
+"""
+
+import array
+import binascii
+import struct
+import sys
+
+MAGIC = b"QTNB"
+VERSION = 1
+EXTENSION = ".qtn"
+
+_HEADER = struct.Struct("<HBIIII")
+_STRLEN = struct.Struct("<H")
+
+
+def isBinary(data):
+    """Return True if the given leading bytes are of the binary format."""
+    return data[:len(MAGIC)] == MAGIC
+
+
+def _toBytes(arr):
+    if sys.byteorder == "big":
+        arr.byteswap()
+    if hasattr(arr, "tobytes"):
+        return arr.tobytes()
+    return arr.tostring()
+
+
+def _fromBytes(typecode, data, offset, count):
+    arr = array.array(typecode)
+    end = offset + arr.itemsize * count
+    if hasattr(arr, "frombytes"):
+        arr.frombytes(data[offset:end])
+    else:
+        arr.fromstring(data[offset:end])
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr, end
+
+
+def _packUUIDs(uuids):
+    """Return the uuid strings as one block of 16 raw bytes each."""
+    hexDigits = "".join(uuids).replace("-", "")
+    if len(hexDigits) != 32 * len(uuids):
+        raise ValueError("Node ids must be uuid strings.")
+    return binascii.unhexlify(hexDigits)
+
+
+def _unpackUUIDs(block):
+    """Return the list of uuid strings stored in the raw bytes block."""
+    hexDigits = binascii.hexlify(block).decode("ascii")
+    return ["-".join((h[0:8], h[8:12], h[12:16], h[16:20], h[20:32]))
+            for h in (hexDigits[i:i + 32]
+                      for i in range(0, len(hexDigits), 32))]
+
+
+def _indexCode(count):
+    """Return the smallest unsigned array typecode that can index count."""
+    return "H" if count <= 0xFFFF else "I"
+
+
+def dumps(sceneData):
+    """Return the serialized scene as bytes."""
+    nodes = sceneData["nodes"]
+    edges = sceneData["edges"]
+
+    classes = []
+    classIndex = {}
+    knobNames = []
+    knobIndex = {}
+    nodeIndex = {}
+
+    def intern(value, values, index):
+        try:
+            return index[value]
+        except KeyError:
+            index[value] = len(values)
+            values.append(value)
+            return index[value]
+
+    nodeClasses = []
+    uuids = []
+    for i, nodeData in enumerate(nodes):
+        nodeIndex[nodeData["uuid"]] = i
+        nodeClasses.append(intern(nodeData["class"], classes, classIndex))
+        uuids.append(nodeData["uuid"])
+
+    edgeIndices = []
+    for edgeData in edges:
+        edgeIndices.extend((
+            nodeIndex[edgeData["source_nodeId"]],
+            intern(edgeData["source_name"], knobNames, knobIndex),
+            nodeIndex[edgeData["target_nodeId"]],
+            intern(edgeData["target_name"], knobNames, knobIndex),
+        ))
+
+    code = _indexCode(max(len(nodes), len(classes), len(knobNames)))
+
+    parts = [MAGIC, _HEADER.pack(VERSION, array.array(code).itemsize,
+                                 len(classes), len(knobNames),
+                                 len(nodes), len(edges))]
+    for name in classes + knobNames:
+        encoded = name.encode("utf-8")
+        parts.append(_STRLEN.pack(len(encoded)))
+        parts.append(encoded)
+
+    parts.append(_toBytes(array.array(code, nodeClasses)))
+    parts.append(_packUUIDs(uuids))
+    parts.append(_toBytes(array.array("d", [n["x"] for n in nodes])))
+    parts.append(_toBytes(array.array("d", [n["y"] for n in nodes])))
+    parts.append(_toBytes(array.array(code, edgeIndices)))
+    return b"".join(parts)
+
+
+def loads(data):
+    """Return the serialized scene from the given bytes."""
+    if not isBinary(data):
+        raise ValueError("Not a binary scene.")
+
+    offset = len(MAGIC)
+    (version, indexSize, numClasses, numKnobNames,
+     numNodes, numEdges) = _HEADER.unpack_from(data, offset)
+    if version != VERSION:
+        raise ValueError("Unsupported binary scene version: {0}"
+                         .format(version))
+    offset += _HEADER.size
+    code = "H" if indexSize == 2 else "I"
+
+    strings = []
+    for _ in range(numClasses + numKnobNames):
+        length, = _STRLEN.unpack_from(data, offset)
+        offset += _STRLEN.size
+        strings.append(data[offset:offset + length].decode("utf-8"))
+        offset += length
+    classes = strings[:numClasses]
+    knobNames = strings[numClasses:]
+
+    nodeClasses, offset = _fromBytes(code, data, offset, numNodes)
+    uuids = _unpackUUIDs(data[offset:offset + 16 * numNodes])
+    offset += 16 * numNodes
+    xs, offset = _fromBytes("d", data, offset, numNodes)
+    ys, offset = _fromBytes("d", data, offset, numNodes)
+    edgeIndices, offset = _fromBytes(code, data, offset, numEdges * 4)
+
+    nodes = [{"class": classes[c], "uuid": u, "x": x, "y": y}
+             for c, u, x, y in zip(nodeClasses, uuids, xs, ys)]
+
+    edges = [{"source_nodeId": uuids[sn], "source_name": knobNames[sk],
+              "target_nodeId": uuids[tn], "target_name": knobNames[tk]}
+             for sn, sk, tn, tk in zip(edgeIndices[0::4], edgeIndices[1::4],
+                                       edgeIndices[2::4], edgeIndices[3::4])]
+
+    return {"nodes": nodes, "edges": edges}
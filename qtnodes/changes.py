@@ -0,0 +1,427 @@
+"""Tracking and applying incremental scene changes.
+
+A delta describes how one serialized scene differs from another, in the
+same terms as the scene data itself (fit for json):
+
+    {
+        "nodes": [nodeData, ...],          # Added or changed Nodes.
+        "removed_nodes": [uuid, ...],      # Including their Edges.
+        "edges": [edgeData, ...],          # Added Edges.
+        "removed_edges": [edgeData, ...],
+    }
+
+Applying a delta is idempotent, so replaying it twice does no harm.
+"""
+
+from . import model as graphmodel
+
+
+def emptyDelta():
+    return {"nodes": [], "removed_nodes": [], "edges": [], "removed_edges": []}
+
+
+def isEmptyDelta(delta):
+    return not any(delta[key] for key in emptyDelta())
+
+
+def edgeKey(edgeData):
+    """Return a hashable identity for the serialized Edge."""
+    return (edgeData["source_nodeId"], edgeData["source_name"],
+            edgeData["target_nodeId"], edgeData["target_name"])
+
+
+def _edgeData(key):
+    return {
+        "source_nodeId": key[0],
+        "source_name": key[1],
+        "target_nodeId": key[2],
+        "target_name": key[3],
+    }
+
+
+def applyDelta(sceneData, delta):
+    """Return new scene data with the delta applied to the given one."""
+    removedNodes = set(delta["removed_nodes"])
+    removedEdges = set(edgeKey(e) for e in delta["removed_edges"])
+
+    changedNodes = {}
+    for nodeData in delta["nodes"]:
+        changedNodes[nodeData["uuid"]] = nodeData
+
+    nodes = []
+    for nodeData in sceneData["nodes"]:
+        uuid = nodeData["uuid"]
+        if uuid in removedNodes:
+            continue
+        nodes.append(changedNodes.pop(uuid, nodeData))
+    # What is left has not been there before.
+    nodes.extend(n for n in delta["nodes"] if n["uuid"] in changedNodes)
+
+    edges = []
+    seen = set()
+    for edgeData in sceneData["edges"]:
+        key = edgeKey(edgeData)
+        if key in seen or key in removedEdges:
+            continue
+        if key[0] in removedNodes or key[2] in removedNodes:
+            continue
+        seen.add(key)
+        edges.append(edgeData)
+    for edgeData in delta["edges"]:
+        key = edgeKey(edgeData)
+        if key not in seen and key not in removedEdges:
+            seen.add(key)
+            edges.append(edgeData)
+
+    return {"nodes": nodes, "edges": edges}
+
+
+def diffSceneData(sceneData, otherData):
+    """Return the delta that turns sceneData into otherData.
+
+    A Node that changed its class is removed and added again, together
+    with its Edges.
+    """
+    delta = emptyDelta()
+
+    oldNodes = dict((n["uuid"], n) for n in sceneData["nodes"])
+    newIds = set()
+    replaced = set()
+    for nodeData in otherData["nodes"]:
+        uuid = nodeData["uuid"]
+        newIds.add(uuid)
+        old = oldNodes.get(uuid)
+        if old is None:
+            delta["nodes"].append(nodeData)
+        elif old["class"] != nodeData["class"]:
+            replaced.add(uuid)
+            delta["removed_nodes"].append(uuid)
+            delta["nodes"].append(nodeData)
+        elif old["x"] != nodeData["x"] or old["y"] != nodeData["y"]:
+            delta["nodes"].append(nodeData)
+    delta["removed_nodes"].extend(u for u in oldNodes if u not in newIds)
+
+    oldEdges = set(edgeKey(e) for e in sceneData["edges"])
+    newEdges = set()
+    for edgeData in otherData["edges"]:
+        key = edgeKey(edgeData)
+        newEdges.add(key)
+        if (key not in oldEdges or
+                key[0] in replaced or key[2] in replaced):
+            delta["edges"].append(edgeData)
+    delta["removed_edges"] = [e for e in sceneData["edges"]
+                              if edgeKey(e) not in newEdges]
+    return delta
+
+
+class ChangeTracker(object):
+    """Collect the changes made to a GraphModel, e.g. since the last save.
+
+    Work is proportional to the number of changes, not the model size.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._dirtyNodes = set()  # uuids of added or moved Nodes.
+        self._addedNodes = set()
+        self._removedNodes = set()
+        self._addedEdges = set()  # edgeKey() tuples.
+        self._removedEdges = set()
+        model.subscribe(self._onChange)
+
+    def detach(self):
+        """Stop tracking the model."""
+        self.model.unsubscribe(self._onChange)
+
+    def hasChanges(self):
+        return bool(self._dirtyNodes or self._removedNodes or
+                    self._addedEdges or self._removedEdges)
+
+    def dirtyNodes(self):
+        """Return the uuids of all Nodes added or moved so far."""
+        return set(self._dirtyNodes)
+
+    def touchedNodes(self):
+        """Return the uuids of all Nodes added, connected or disconnected
+        so far (but not the ones that have only been moved)."""
+        touched = set(self._addedNodes)
+        for key in self._addedEdges | self._removedEdges:
+            touched.add(key[0])
+            touched.add(key[2])
+        return set(u for u in touched if self.model.node(u) is not None)
+
+    def reset(self):
+        """Forget all changes collected so far."""
+        self._dirtyNodes.clear()
+        self._addedNodes.clear()
+        self._removedNodes.clear()
+        self._addedEdges.clear()
+        self._removedEdges.clear()
+
+    def takeDelta(self):
+        """Return the collected changes as delta and reset."""
+        delta = self.peekDelta()
+        self.reset()
+        return delta
+
+    def peekDelta(self):
+        """Return the collected changes as delta."""
+        delta = emptyDelta()
+        for uuid in self._dirtyNodes:
+            node = self.model.node(uuid)
+            if node is not None:
+                delta["nodes"].append({
+                    "class": node.cls,
+                    "uuid": node.uuid,
+                    "x": node.x,
+                    "y": node.y,
+                })
+        delta["removed_nodes"] = list(self._removedNodes)
+        delta["edges"] = [_edgeData(key) for key in self._addedEdges]
+        delta["removed_edges"] = [_edgeData(k) for k in self._removedEdges]
+        return delta
+
+    def _edgeKey(self, edge):
+        return (self.model.nodeById(edge.source).uuid, edge.sourceKnob,
+                self.model.nodeById(edge.target).uuid, edge.targetKnob)
+
+    def _nodeAdded(self, uuid):
+        self._removedNodes.discard(uuid)
+        self._dirtyNodes.add(uuid)
+
+    def _nodeRemoved(self, uuid):
+        self._dirtyNodes.discard(uuid)
+        self._addedNodes.discard(uuid)
+        self._removedNodes.add(uuid)
+
+    def _edgeAdded(self, key):
+        if key in self._removedEdges:
+            self._removedEdges.discard(key)
+        else:
+            self._addedEdges.add(key)
+
+    def _edgeRemoved(self, key):
+        if key in self._addedEdges:
+            self._addedEdges.discard(key)
+        else:
+            self._removedEdges.add(key)
+
+    def _onChange(self, event, record, *args):
+        if event == graphmodel.NODE_ADDED:
+            self._nodeAdded(record.uuid)
+            self._addedNodes.add(record.uuid)
+        elif event == graphmodel.NODE_MOVED:
+            self._nodeAdded(record.uuid)
+        elif event == graphmodel.NODE_REMOVED:
+            self._nodeRemoved(record.uuid)
+        elif event == graphmodel.NODE_RENAMED:
+            # Same as removing the Node and adding it again, Edges included.
+            oldUuid, = args
+            self._nodeRemoved(oldUuid)
+            self._addedEdges = set(k for k in self._addedEdges
+                                   if oldUuid not in (k[0], k[2]))
+            self._nodeAdded(record.uuid)
+            self._addedNodes.add(record.uuid)
+            for edge in (self.model.outEdges(record) +
+                         self.model.inEdges(record)):
+                self._edgeAdded(self._edgeKey(edge))
+        elif event == graphmodel.EDGE_ADDED:
+            self._edgeAdded(self._edgeKey(edge=record))
+        elif event == graphmodel.EDGE_REMOVED:
+            self._edgeRemoved(self._edgeKey(edge=record))
+
+
+def removalDelta(model):
+    """Return the delta that removes all Nodes of the GraphModel."""
+    delta = emptyDelta()
+    delta["removed_nodes"] = [node.uuid for node in model.nodes()]
+    return delta
+
+
+class _Snapshot(object):
+    """Scene data indexed by uuid and edgeKey(), changed in place."""
+
+    def __init__(self, sceneData):
+        self.nodes = dict((n["uuid"], n) for n in sceneData["nodes"])
+        self.edges = {}
+        self.edgesByNode = {}  # uuid -> edgeKeys of its Edges.
+        for edgeData in sceneData["edges"]:
+            self._addEdge(edgeKey(edgeData), edgeData)
+
+    def _addEdge(self, key, edgeData):
+        self.edges[key] = edgeData
+        self.edgesByNode.setdefault(key[0], set()).add(key)
+        self.edgesByNode.setdefault(key[2], set()).add(key)
+
+    def _removeEdge(self, key):
+        if self.edges.pop(key, None) is None:
+            return
+        # Both ends are the same Node for a loop.
+        for uuid in set((key[0], key[2])):
+            keys = self.edgesByNode[uuid]
+            keys.discard(key)
+            if not keys:
+                del self.edgesByNode[uuid]
+
+    def apply(self, change):
+        """Same as applyDelta(), but only touches what changed."""
+        for uuid in change.removedNodes:
+            self.nodes.pop(uuid, None)
+            for key in list(self.edgesByNode.get(uuid, ())):
+                self._removeEdge(key)
+        self.nodes.update(change.nodes)
+        for key in change.removedEdges:
+            self._removeEdge(key)
+        for key, edgeData in change.edges.items():
+            self._addEdge(key, edgeData)
+
+
+class _Change(object):
+    """A delta, indexed by uuid and edgeKey()."""
+
+    def __init__(self, delta):
+        self.removedNodes = set(delta["removed_nodes"])
+        self.nodes = dict((n["uuid"], n) for n in delta["nodes"])
+        self.removedEdges = set(edgeKey(e) for e in delta["removed_edges"])
+        self.edges = {}
+        self.edgesByNode = {}
+        for edgeData in delta["edges"]:
+            key = edgeKey(edgeData)
+            if key not in self.removedEdges:
+                self.edges[key] = edgeData
+                self.edgesByNode.setdefault(key[0], set()).add(key)
+                self.edgesByNode.setdefault(key[2], set()).add(key)
+
+
+class SceneHistory(object):
+    """States of a scene held to be restored later on.
+
+    The oldest state is kept as a whole, every later one as the changes
+    since the one before. Holding and restoring a state take time in
+    proportion to what changed in between, not to the size of the scene.
+    Once there are more than maxlen states, the oldest is dropped and
+    the next one becomes the new base.
+    """
+
+    def __init__(self, maxlen=10):
+        self.maxlen = maxlen
+        self._base = None  # The _Snapshot of the oldest state.
+        # [(label, [_Change])], leading from the state before. The first
+        # entry has no changes.
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def labels(self):
+        """Return the labels of the held states, oldest first."""
+        return [label for label, _ in self._entries]
+
+    def hold(self, label, sceneData=None, deltas=()):
+        """Add a state, given as scene data if it is the first one and as
+        the deltas since the previous one otherwise."""
+        if not self._entries:
+            self._base = _Snapshot(sceneData)
+            self._entries.append((label, []))
+        else:
+            self._entries.append((label, [_Change(d) for d in deltas
+                                          if not isEmptyDelta(d)]))
+
+        while len(self._entries) > self.maxlen:
+            del self._entries[0]
+            label, changes = self._entries[0]
+            for change in changes:
+                self._base.apply(change)
+            self._entries[0] = (label, [])
+
+    def clear(self):
+        self._base = None
+        self._entries = []
+
+    def _changesUntil(self, index):
+        return [c for _, changes in self._entries[1:index + 1]
+                for c in changes]
+
+    def _node(self, changes, uuid):
+        nodeData = self._base.nodes.get(uuid)
+        for change in changes:
+            if uuid in change.removedNodes:
+                nodeData = None
+            nodeData = change.nodes.get(uuid, nodeData)
+        return nodeData
+
+    def _edge(self, changes, key):
+        edgeData = self._base.edges.get(key)
+        for change in changes:
+            if (key in change.removedEdges or
+                    key[0] in change.removedNodes or
+                    key[2] in change.removedNodes):
+                edgeData = None
+            edgeData = change.edges.get(key, edgeData)
+        return edgeData
+
+    def _edgeKeys(self, changes, uuid):
+        """Return the keys of all Edges the Node might have had."""
+        keys = set(self._base.edgesByNode.get(uuid, ()))
+        for change in changes:
+            keys.update(change.edgesByNode.get(uuid, ()))
+        return keys
+
+    def deltaTo(self, model, index=-1, pending=()):
+        """Return the delta that restores the held state in the model.
+
+        pending are the deltas since the last state has been held, which
+        lead to the model's current state.
+        """
+        if index < 0:
+            index += len(self._entries)
+        changes = self._changesUntil(index)
+        later = (self._changesUntil(len(self._entries))[len(changes):] +
+                 [_Change(d) for d in pending])
+
+        # Only what changed since may differ.
+        uuids = set()
+        keys = set()
+        for change in later:
+            uuids.update(change.removedNodes)
+            uuids.update(change.nodes)
+            keys.update(change.removedEdges)
+            keys.update(change.edges)
+
+        delta = emptyDelta()
+        replaced = set()
+        for uuid in uuids:
+            # Removed Nodes took their Edges along.
+            keys.update(self._edgeKeys(changes, uuid))
+            nodeData = self._node(changes, uuid)
+            node = model.node(uuid)
+            if nodeData is None:
+                if node is not None:
+                    delta["removed_nodes"].append(uuid)
+                continue
+            if node is not None and node.cls != nodeData["class"]:
+                delta["removed_nodes"].append(uuid)
+                replaced.add(uuid)
+                node = None
+            if node is None or (node.x, node.y) != (nodeData["x"],
+                                                    nodeData["y"]):
+                delta["nodes"].append(nodeData)
+
+        for key in keys:
+            edgeData = self._edge(changes, key)
+            connected = (key[0] not in replaced and
+                         key[2] not in replaced and
+                         _isConnected(model, key))
+            if edgeData is not None and not connected:
+                delta["edges"].append(edgeData)
+            elif edgeData is None and connected:
+                delta["removed_edges"].append(_edgeData(key))
+        return delta
+
+
+def _isConnected(model, key):
+    source = model.node(key[0])
+    target = model.node(key[2])
+    if source is None or target is None:
+        return False
+    return model.isConnected(source, key[1], target, key[3])
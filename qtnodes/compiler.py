@@ -0,0 +1,217 @@
+"""Compile a graph into a plain Python function.
+
+For running the same graph many times with different parameters, the
+Evaluator's bookkeeping costs more than the compute functions do. The
+Compiler generates Python source instead, which calls the compute
+functions of all Nodes in topological order and passes values along in
+local variables:
+
+    def chunk0(parameters, values):
+        o0 = c0({}, parameters.get('uuid-a', d0)) or {}
+        o1 = c1({'x': o0.get('value')}, parameters.get('uuid-b', d1)) or {}
+        values[1] = o1
+
+Large graphs are split into chunks of about CHUNK_SIZE Nodes, one
+function each. Only the values needed by later chunks go through a dict.
+
+    compiler = Compiler(scene.model, graph.nodeClasses)
+    run = compiler.compile()
+    for value in range(1000):
+        results = run({intNode.uuid: {"value": value}})
+
+The compiled function takes the parameters of some Nodes as {uuid:
+params} and returns the outputs of the requested Nodes (by default all
+Nodes without outgoing Edges) as {uuid: outputs}. Inputs are passed the
+same way as by the Evaluator. Compute functions must not modify the
+inputs or params they get, as those may be shared between runs.
+
+The Compiler follows changes of the GraphModel. After an edit, only the
+chunks with Nodes whose Edges, Knobs or uuid changed are compiled again,
+and compile() returns the previous function as long as nothing changed.
+"""
+
+from . import model as graphmodel
+from .evaluation import upstreamOrder, classMap, nodeClass
+from .exceptions import EvaluationError
+from .serializer import loadModel
+
+
+# The average number of Nodes compiled into one function. After an edit,
+# only the functions of the chunks involved are compiled again.
+CHUNK_SIZE = 256
+
+
+class Compiler(object):
+    """Turn a GraphModel into a function, see module docstring."""
+
+    def __init__(self, model, nodeClasses=()):
+        self.model = model
+        self.nodeClasses = nodeClasses
+
+        # Node id -> the statement that computes it.
+        self._statements = {}
+        # The last compile(), as (key, function), see _compileKey().
+        self._compiled = None
+        # Chunk source -> its compiled code, from the last compile().
+        self._codes = {}
+
+        model.subscribe(self._onChange)
+
+    def detach(self):
+        """Stop following changes of the model."""
+        self.model.unsubscribe(self._onChange)
+
+    def compile(self, outputs=None, parameters=None):
+        """Return a function computing the graph.
+
+        outputs are the uuids of the Nodes to return the outputs of,
+        parameters the default {uuid: params} for Nodes that are not
+        given any when the function is called.
+        """
+        if outputs is None:
+            outputs = [node.uuid for node in self.model.nodes()
+                       if not self.model.outEdges(node)]
+        key = _compileKey(outputs, parameters)
+        if self._compiled is not None and _sameKey(self._compiled[0], key):
+            return self._compiled[1]
+
+        nodes = [self.model.node(uuid) for uuid in outputs]
+        if None in nodes:
+            raise EvaluationError("Can only compile the outputs of Nodes "
+                                  "that are part of the model.")
+        order = upstreamOrder(self.model, [node.id for node in nodes])
+        classes = classMap(self.nodeClasses)
+        parameters = parameters or {}
+
+        namespace = {"EMPTY": {}}
+        chunks = self._chunks(order, [node.id for node in nodes])
+        codes = {}
+        lines = ["def run(parameters=EMPTY):", "    values = {}"]
+        for chunk, liveIn, liveOut in chunks:
+            for nodeId in chunk:
+                node = self.model.nodeById(nodeId)
+                cls = nodeClass(node, classes)
+                namespace["c{0}".format(nodeId)] = cls.compute
+                namespace["d{0}".format(nodeId)] = parameters.get(node.uuid,
+                                                                  {})
+            source = self._chunkSource(chunk, liveIn, liveOut)
+            code = self._codes.get(source)
+            if code is None:
+                code = compile(source, "<compiled graph>", "exec")
+            codes[source] = code
+            exec(code, namespace)
+            lines.append("    chunk{0}(parameters, values)".format(chunk[0]))
+        lines.append("    return {{{0}}}".format(", ".join(
+            "{0!r}: values[{1}]".format(node.uuid, node.id)
+            for node in nodes)))
+        exec(compile("\n".join(lines), "<compiled graph>", "exec"), namespace)
+
+        # Only keep what is still in use.
+        self._codes = codes
+        function = namespace["run"]
+        self._compiled = (key, function)
+        return function
+
+    def _chunks(self, order, outputIds):
+        """Split the ordered Node ids into chunks.
+
+        Return a (chunk, liveIn, liveOut) tuple for each, with the ids of
+        the Nodes it computes, the ones from earlier chunks it needs and
+        the ones needed later on.
+
+        Whether a chunk ends after a Node depends on the Node's id only,
+        so an edit does not move the boundaries of all following chunks.
+        """
+        chunks = [[]]
+        chunkOf = {}
+        for nodeId in order:
+            chunks[-1].append(nodeId)
+            chunkOf[nodeId] = len(chunks) - 1
+            if (nodeId * 2654435761) % 2 ** 32 < 2 ** 32 // CHUNK_SIZE:
+                chunks.append([])
+        if not chunks[-1]:
+            chunks.pop()
+
+        liveIns = [set() for _ in chunks]
+        liveOut = set(outputIds)
+        for nodeId in order:
+            for edge in self.model.inEdges(self.model.nodeById(nodeId)):
+                if chunkOf[edge.source] != chunkOf[nodeId]:
+                    liveIns[chunkOf[nodeId]].add(edge.source)
+                    liveOut.add(edge.source)
+        return [(chunk, sorted(liveIn),
+                 [nodeId for nodeId in chunk if nodeId in liveOut])
+                for chunk, liveIn in zip(chunks, liveIns)]
+
+    def _chunkSource(self, chunk, liveIn, liveOut):
+        """Return the code of a function computing the chunk's Nodes."""
+        lines = ["def chunk{0}(parameters, values):".format(chunk[0])]
+        lines.extend("    o{0} = values[{0}]".format(nodeId)
+                     for nodeId in liveIn)
+        for nodeId in chunk:
+            statement = self._statements.get(nodeId)
+            if statement is None:
+                statement = self._statement(self.model.nodeById(nodeId))
+                self._statements[nodeId] = statement
+            lines.append(statement)
+        lines.extend("    values[{0}] = o{0}".format(nodeId)
+                     for nodeId in liveOut)
+        return "\n".join(lines)
+
+    def _statement(self, node):
+        """Return the line of code that computes the Node."""
+        connected = {}
+        for edge in self.model.inEdges(node):
+            value = "o{0}.get({1!r})".format(edge.source, edge.sourceKnob)
+            connected.setdefault(edge.targetKnob, []).append(value)
+        inputs = []
+        for name in sorted(connected):
+            values = connected[name]
+            if len(values) == 1:
+                inputs.append("{0!r}: {1}".format(name, values[0]))
+            else:
+                inputs.append("{0!r}: [{1}]".format(name, ", ".join(values)))
+        # Like the Evaluator, take no outputs for None.
+        return ("    o{0} = c{0}({{{1}}}, parameters.get({2!r}, d{0})) "
+                "or {{}}".format(node.id, ", ".join(inputs), node.uuid))
+
+    def _forget(self, nodeId):
+        self._statements.pop(nodeId, None)
+        self._compiled = None
+
+    def _onChange(self, event, record, *args):
+        if event in (graphmodel.EDGE_ADDED, graphmodel.EDGE_REMOVED):
+            self._forget(record.target)
+        elif event in (graphmodel.KNOBS_CHANGED, graphmodel.NODE_RENAMED,
+                       graphmodel.NODE_REMOVED):
+            self._forget(record.id)
+        elif event == graphmodel.NODE_ADDED:
+            self._compiled = None
+
+
+def _compileKey(outputs, parameters):
+    """Return what compile() depends on, besides the graph."""
+    return (list(outputs),
+            sorted((parameters or {}).items(), key=lambda item: item[0]))
+
+
+def _sameKey(key, other):
+    """Compare two _compileKey()s.
+
+    The parameters of each Node are compared by identity: the compiled
+    function uses those very dicts, and their values (e.g. NumPy arrays)
+    may not be comparable.
+    """
+    (outputs, parameters), (otherOutputs, otherParameters) = key, other
+    return (outputs == otherOutputs and
+            len(parameters) == len(otherParameters) and
+            all(uuid == otherUuid and params is otherParams
+                for (uuid, params), (otherUuid, otherParams)
+                in zip(parameters, otherParameters)))
+
+
+def compileSceneData(sceneData, nodeClasses, outputs=None, parameters=None):
+    """Return a function computing the serialized scene, e.g. as loaded
+    by serializer.loadSceneFromFile()."""
+    return Compiler(loadModel(sceneData), nodeClasses).compile(
+        outputs, parameters)
@@ -5,6 +5,7 @@ import os
 from PySide import QtGui
 from PySide import QtCore
 
+from .helpers import getLevelOfDetail, LOD_FULL
 
 windows = os.name == "nt"
 
@@ -24,6 +25,9 @@ class Edge(QtGui.QGraphicsPathItem):
         self.source = None  # A Knob.
         self.target = None  # A Knob.
 
+        # Our representation in the scene's GraphModel, once connected.
+        self.record = None
+
         self.sourcePos = QtCore.QPointF(0, 0)
         self.targetPos = QtCore.QPointF(0, 0)
 
@@ -34,6 +38,9 @@ class Edge(QtGui.QGraphicsPathItem):
         self.curv4 = 0.8
 
         self.setAcceptHoverEvents(True)
+        self.setPen(QtGui.QPen(self.lineColor, self.thickness))
+        self.setBrush(QtCore.Qt.NoBrush)
+        self.setZValue(-1)
 
     def mousePressEvent(self, event):
         """Delete Edge if icon is clicked with DELETE_MODIFIER_KEY pressed."""
@@ -46,11 +53,11 @@ class Edge(QtGui.QGraphicsPathItem):
         """Adjust current shape based on Knobs and curvature settings."""
         if self.source:
             self.sourcePos = self.source.mapToScene(
-                self.source.boundingRect().center())
+                self.source.rect().center())
 
         if self.target:
             self.targetPos = self.target.mapToScene(
-                self.target.boundingRect().center())
+                self.target.rect().center())
 
         path = QtGui.QPainterPath()
         path.moveTo(self.sourcePos)
@@ -66,20 +73,46 @@ class Edge(QtGui.QGraphicsPathItem):
         self.setPath(path)
 
     def paint(self, painter, option, widget):
-        """Paint Edge color depending on modifier key pressed or not."""    
+        """Paint Edge color depending on modifier key pressed or not.
+
+        When zoomed out, a straight line is drawn instead of the curve,
+        see getLevelOfDetail().
+        """
         mod = QtGui.QApplication.keyboardModifiers() == DELETE_MODIFIER_KEY
-        if mod:
-            self.setPen(QtGui.QPen(self.removalColor, self.thickness))
-        else:
-            self.setPen(QtGui.QPen(self.lineColor, self.thickness))
+        color = self.removalColor if mod else self.lineColor
+        painter.setPen(QtGui.QPen(color, self.thickness))
+        painter.setBrush(QtCore.Qt.NoBrush)
 
-        self.setBrush(QtCore.Qt.NoBrush)
-        self.setZValue(-1)
-        super(Edge, self).paint(painter, option, widget)
+        if getLevelOfDetail(painter, option) == LOD_FULL:
+            painter.drawPath(self.path())
+        else:
+            painter.drawLine(self.sourcePos, self.targetPos)
+
+    def register(self):
+        """Add a record for this (fully connected) Edge to the GraphModel.
+
+        This is to be called once source and target are final, that is
+        after ensureEdgeDirection().
+        """
+        if self.record is not None or not (self.source and self.target):
+            return
+        sourceRecord = self.source.node().record
+        targetRecord = self.target.node().record
+        if sourceRecord is None or targetRecord is None:
+            return
+        model = self.scene().model
+        self.record = model.addEdge(sourceRecord, self.source.name,
+                                    targetRecord, self.target.name,
+                                    item=self)
 
     def destroy(self):
         """Remove this Edge and its reference in other objects."""
         print("destroy edge:", self)
+        if self.record is not None:
+            scene = self.scene()
+            if scene is not None:
+                scene.model.removeEdge(self.record)
+            self.record = None
         if self.source:
             self.source.removeEdge(self)
         if self.target:
@@ -0,0 +1,209 @@
+"""Dataflow evaluation of the GraphModel.
+
+Values flow along the Edges, from OutputKnobs to InputKnobs (the
+direction enforced by ensureEdgeDirection()). A Node class takes part by
+providing a compute function, which gets the values of its inputs and
+the Node's parameters and returns the values of its outputs:
+
+    class Multiply(Node):
+
+        @staticmethod
+        def compute(inputs, params):
+            return {"value": inputs.get("x", 0) * inputs.get("y", 0)}
+
+The inputs are given by Knob name. An InputKnob with one Edge passes the
+value of the connected output, one with several Edges a list of them (in
+the order they have been connected). Unconnected inputs are left out.
+
+The results are memoized per Node. Any change (a parameter, an Edge, the
+Knobs) marks the Node and everything downstream of it as dirty, and only
+dirty Nodes are computed again, so the cost of a change is proportional
+to its downstream cone, not to the size of the graph.
+"""
+
+from . import model as graphmodel
+from .exceptions import EvaluationError, UnregisteredNodeClassError
+
+
+def upstreamOrder(model, nodeIds, skip=()):
+    """Return the ids of the given Nodes and all Nodes feeding them, each
+    after the ones it depends on.
+
+    Nodes in skip are not entered, nor is anything upstream of them.
+    Raises EvaluationError if there is a cycle.
+    """
+    visiting = set()
+    done = set()
+    order = []
+    stack = [(nodeId, False) for nodeId in reversed(list(nodeIds))]
+    while stack:
+        nodeId, expanded = stack.pop()
+        if expanded:
+            visiting.discard(nodeId)
+            done.add(nodeId)
+            order.append(nodeId)
+            continue
+        if nodeId in done or nodeId in skip:
+            continue
+        if nodeId in visiting:
+            raise EvaluationError(
+                "The graph contains a cycle through {0}.".format(
+                    model.nodeById(nodeId)))
+        visiting.add(nodeId)
+        stack.append((nodeId, True))
+        for edge in reversed(model.inEdges(model.nodeById(nodeId))):
+            stack.append((edge.source, False))
+    return order
+
+
+def classMap(nodeClasses):
+    """Return the node classes by name, from a list or dict of them."""
+    if isinstance(nodeClasses, dict):
+        return nodeClasses
+    return dict((cls.__name__, cls) for cls in nodeClasses)
+
+
+def lookupNodeClass(node, classes):
+    """Return the class of the NodeRecord.
+
+    Nodes that have an item use its class, all others are looked up by
+    name in the classMap().
+    """
+    if node.item is not None:
+        return type(node.item)
+    cls = classes.get(node.cls)
+    if cls is None:
+        raise UnregisteredNodeClassError(
+            "Node class {0} is not registered.".format(node.cls))
+    return cls
+
+
+def nodeClass(node, classes):
+    """Return the class of the NodeRecord, it must have a compute
+    function."""
+    cls = lookupNodeClass(node, classes)
+    if getattr(cls, "compute", None) is None:
+        raise EvaluationError(
+            "Node class {0} has no compute function.".format(node.cls))
+    return cls
+
+
+def topologicalOrder(model):
+    """Return all NodeRecords, each after the ones feeding it."""
+    order = upstreamOrder(model, [node.id for node in model.nodes()])
+    return [model.nodeById(nodeId) for nodeId in order]
+
+
+class Evaluator(object):
+    """Compute the values of a GraphModel's Nodes, on demand.
+
+    The node classes are looked up by the class name of each NodeRecord,
+    in the given list or dict (e.g. NodeGraphWidget.nodeClasses, which
+    may still change later on). Nodes that have an item use its class.
+    """
+
+    def __init__(self, model, nodeClasses=()):
+        self.model = model
+        self.nodeClasses = nodeClasses
+
+        self._params = {}  # Node id -> {name: value}.
+        # Node id -> {output: value}, for the Nodes that are not dirty.
+        # Everything upstream of a Node in here is in here as well.
+        self._values = {}
+        # Ids of the Nodes that are not in _values.
+        self._dirty = set(node.id for node in model.nodes())
+
+        model.subscribe(self._onChange)
+
+    def detach(self):
+        """Stop following changes of the model."""
+        self.model.unsubscribe(self._onChange)
+
+    # Parameters.
+
+    def parameters(self, node):
+        """Return a copy of the NodeRecord's parameters."""
+        return dict(self._params.get(node.id, {}))
+
+    def setParameter(self, node, name, value):
+        """Change a parameter, which makes the Node and its downstream
+        Nodes dirty."""
+        self._params.setdefault(node.id, {})[name] = value
+        self.invalidate(node)
+
+    # Dirty state.
+
+    def isDirty(self, node):
+        return node.id not in self._values
+
+    def invalidate(self, node):
+        """Forget the values of the Node and everything downstream."""
+        self._invalidate(node.id)
+
+    def _invalidate(self, nodeId):
+        stack = [nodeId]
+        while stack:
+            nodeId = stack.pop()
+            # Anything downstream of a dirty Node is dirty already.
+            if self._values.pop(nodeId, None) is None:
+                continue
+            self._dirty.add(nodeId)
+            for edge in self.model.outEdges(self.model.nodeById(nodeId)):
+                stack.append(edge.target)
+
+    # Evaluation.
+
+    def evaluate(self, node):
+        """Return the NodeRecord's outputs as {name: value}.
+
+        Only the dirty Nodes upstream of it are computed.
+        """
+        self._update([node.id])
+        return dict(self._values[node.id])
+
+    def evaluateAll(self):
+        """Compute all dirty Nodes."""
+        self._update(sorted(self._dirty))
+
+    def value(self, node, output):
+        """Return the value of one of the Node's outputs."""
+        return self.evaluate(node).get(output)
+
+    def _update(self, nodeIds):
+        order = upstreamOrder(self.model, nodeIds, skip=self._values)
+        if not order:
+            return
+        classes = classMap(self.nodeClasses)
+        for nodeId in order:
+            node = self.model.nodeById(nodeId)
+            cls = nodeClass(node, classes)
+            outputs = cls.compute(self._inputs(node), self.parameters(node))
+            self._setValues(nodeId, outputs)
+
+    def _setValues(self, nodeId, outputs):
+        self._values[nodeId] = dict(outputs or {})
+        self._dirty.discard(nodeId)
+
+    def _inputs(self, node):
+        """Gather the values of the Node's connected inputs."""
+        connected = {}
+        for edge in self.model.inEdges(node):
+            value = self._values[edge.source].get(edge.sourceKnob)
+            connected.setdefault(edge.targetKnob, []).append(value)
+        inputs = {}
+        for name, values in connected.items():
+            inputs[name] = values[0] if len(values) == 1 else values
+        return inputs
+
+    def _onChange(self, event, record, *args):
+        if event == graphmodel.NODE_ADDED:
+            self._dirty.add(record.id)
+        elif event in (graphmodel.EDGE_ADDED, graphmodel.EDGE_REMOVED):
+            self._invalidate(record.target)
+        elif event == graphmodel.KNOBS_CHANGED:
+            self._invalidate(record.id)
+        elif event == graphmodel.NODE_REMOVED:
+            # Its Edges are gone already, which made its targets dirty.
+            self._values.pop(record.id, None)
+            self._dirty.discard(record.id)
+            self._params.pop(record.id, None)
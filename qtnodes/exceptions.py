@@ -18,4 +18,24 @@ class KnobConnectionError(QtNodesError):
 
 
 class DuplicateKnobNameError(QtNodesError):
-	"""A Node's Knobs must have unique names."""
\ No newline at end of file
+    """A Node's Knobs must have unique names."""
+
+
+class GraphModelError(QtNodesError):
+    """An operation on the GraphModel is not valid."""
+
+
+class UnknownLayoutEngineError(QtNodesError):
+    """The layout engine can not be recognized."""
+
+
+class LayoutCancelledError(QtNodesError):
+    """The layout has been cancelled before it was done."""
+
+
+class MissingDependencyError(QtNodesError):
+    """An optional dependency is needed, but not installed."""
+
+
+class EvaluationError(QtNodesError):
+    """The graph can not be evaluated, e.g. because of a cycle."""
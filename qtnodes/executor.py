@@ -0,0 +1,224 @@
+"""Parallel evaluation of independent branches of the graph.
+
+The ParallelEvaluator computes each dirty Node as soon as all Nodes
+feeding it are done, on a pool of worker threads. Threads only run in
+parallel while a compute function does not hold the GIL (e.g. I/O or
+most NumPy operations). CPU bound pure Python code should run in worker
+processes instead, which a node class opts into:
+
+    class Simulate(Node):
+
+        computeInProcess = True
+
+        @staticmethod
+        def compute(inputs, params):
+            ...
+
+Such a class must be importable by the worker processes (defined at the
+top level of a module) and its inputs, parameters and outputs must be
+picklable.
+
+The results are the same as those of the serial Evaluator. If compute
+functions fail, all Nodes that do not depend on a failed one are still
+computed, then the error of the first failed Node in serial order is
+raised. That is the same error the serial Evaluator raises. If a worker
+process dies (e.g. killed for lack of memory), the Nodes it may have
+been computing fail with an EvaluationError.
+"""
+
+import sys
+import pickle
+import multiprocessing
+import multiprocessing.pool
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .evaluation import Evaluator, upstreamOrder, classMap, nodeClass
+from .exceptions import EvaluationError
+
+
+# Seconds between checks whether the worker processes are still alive.
+POLL_INTERVAL = 0.1
+
+
+def _compute(cls, inputs, params):
+    """Return (True, outputs) or (False, error), never raise."""
+    try:
+        return True, cls.compute(inputs, params)
+    except Exception as err:
+        return False, err
+
+
+def _computePickled(task):
+    """Like _compute(), run in a worker process.
+
+    The task and result are pickled here and in _submit(), so anything
+    that can not be pickled becomes an error, instead of getting lost in
+    the pool.
+    """
+    try:
+        result = _compute(*pickle.loads(task))
+    except Exception as err:
+        result = (False, err)
+    try:
+        return pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+    except Exception as err:
+        return pickle.dumps((False, err), pickle.HIGHEST_PROTOCOL)
+
+
+class ParallelEvaluator(Evaluator):
+    """An Evaluator that computes independent Nodes at the same time.
+
+    The pools are started on first use and kept until close().
+    """
+
+    def __init__(self, model, nodeClasses=(), threads=None, processes=None):
+        super(ParallelEvaluator, self).__init__(model, nodeClasses)
+        # Default to the number of CPUs.
+        self.threads = threads or multiprocessing.cpu_count()
+        self.processes = processes or multiprocessing.cpu_count()
+        self._threadPool = None
+        self._processPool = None
+        # The processes of the _processPool, as started.
+        self._workers = []
+
+    def close(self):
+        """Stop the worker threads and processes."""
+        for pool in (self._threadPool, self._processPool):
+            if pool is not None:
+                pool.close()
+                pool.join()
+        self._threadPool = None
+        self._processPool = None
+        self._workers = []
+
+    def _pool(self, cls):
+        if getattr(cls, "computeInProcess", False):
+            if self._processPool is None:
+                self._processPool = multiprocessing.Pool(self.processes)
+                # The pool replaces dead workers silently, along with
+                # their tasks, so keep track of them.
+                self._workers = list(self._processPool._pool)
+            return self._processPool
+        if self._threadPool is None:
+            self._threadPool = multiprocessing.pool.ThreadPool(self.threads)
+        return self._threadPool
+
+    def _update(self, nodeIds):
+        order = upstreamOrder(self.model, nodeIds, skip=self._values)
+        if not order:
+            return
+        classes = classMap(self.nodeClasses)
+        position = dict((nodeId, i) for i, nodeId in enumerate(order))
+
+        # Node id -> number of Nodes still to compute it depends on, and
+        # the other way around, the Nodes to compute that depend on it.
+        waiting = {}
+        targets = {}
+        for nodeId in order:
+            node = self.model.nodeById(nodeId)
+            sources = set(e.source for e in self.model.inEdges(node)
+                          if e.source in position)
+            waiting[nodeId] = len(sources)
+            for source in sources:
+                targets.setdefault(source, []).append(nodeId)
+
+        # Filled by the pools' result threads, as (id, pickled, result).
+        done = queue.Queue()
+        errors = {}
+        # Node id -> whether it is computed in a process, while running.
+        running = {}
+        ready = [nodeId for nodeId in order if not waiting[nodeId]]
+        while ready or running:
+            for nodeId in ready:
+                pickled = self._submit(nodeId, classes, done, errors)
+                if pickled is not None:
+                    running[nodeId] = pickled
+            ready = []
+            if not running:
+                break
+
+            nodeId, pickled, result = self._next(done, running)
+            if nodeId not in running:
+                # Failed already, when its worker died.
+                continue
+            del running[nodeId]
+            if pickled:
+                try:
+                    result = pickle.loads(result)
+                except Exception as err:
+                    result = (False, err)
+            ok, outputs = result
+            if not ok:
+                # Nothing downstream of it will be ready.
+                errors[nodeId] = outputs
+                continue
+            self._setValues(nodeId, outputs)
+            for target in targets.get(nodeId, ()):
+                waiting[target] -= 1
+                if not waiting[target]:
+                    ready.append(target)
+
+        if errors:
+            raise errors[min(errors, key=position.get)]
+
+    def _next(self, done, running):
+        """Return the next (id, pickled, result) from the done queue.
+
+        If a worker process died meanwhile, the Nodes running in
+        processes fail and the process pool is started again on next
+        use.
+        """
+        while True:
+            try:
+                return done.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+            if all(worker.exitcode is None for worker in self._workers):
+                continue
+            self._processPool.terminate()
+            self._processPool.join()
+            self._processPool = None
+            self._workers = []
+            for nodeId, pickled in running.items():
+                if pickled:
+                    err = EvaluationError(
+                        "A worker process died, {0} was not computed.".format(
+                            self.model.nodeById(nodeId)))
+                    done.put((nodeId, False, (False, err)))
+
+    def _submit(self, nodeId, classes, done, errors):
+        """Start computing the Node.
+
+        Return whether it is computed in a process, None if it could not
+        be started.
+        """
+        node = self.model.nodeById(nodeId)
+        try:
+            cls = nodeClass(node, classes)
+        except Exception as err:
+            errors[nodeId] = err
+            return None
+
+        pool = self._pool(cls)
+        pickled = pool is self._processPool
+        args = (cls, self._inputs(node), self.parameters(node))
+        if pickled:
+            try:
+                args = (pickle.dumps(args, pickle.HIGHEST_PROTOCOL),)
+            except Exception as err:
+                errors[nodeId] = err
+                return None
+        kwargs = {}
+        if sys.version_info[0] >= 3:
+            # Anything the pool itself fails with (Python 2 drops it).
+            kwargs["error_callback"] = lambda err: done.put(
+                (nodeId, False, (False, err)))
+        pool.apply_async(
+            _computePickled if pickled else _compute, args,
+            callback=lambda result: done.put((nodeId, pickled, result)),
+            **kwargs)
+        return pickled
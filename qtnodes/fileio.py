@@ -0,0 +1,30 @@
+"""File and JSON helper functions, which do not need Qt."""
+
+import os
+import json
+
+
+def readFileContent(filePath):
+    """Return the content of the file."""
+    with open(filePath) as f:
+        return f.read()
+
+
+def toJson(serialized):
+    """Return JSON string from given native Python datatypes."""
+    return json.dumps(serialized, encoding="utf-8", indent=4)
+
+
+def fromJson(jsonString):
+    """Return native Python datatypes from JSON string."""
+    return json.loads(jsonString, encoding="utf-8")
+
+
+def replaceFile(source, destination):
+    """Move the source file over the destination, replacing it."""
+    try:
+        os.replace(source, destination)
+    except AttributeError:  # Python 2, where rename replaces on POSIX.
+        if os.name == "nt" and os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
@@ -0,0 +1,276 @@
+"""Force-directed graph layout, vectorized with NumPy.
+
+Unlike the layered layout, this does not assume a direction of flow,
+which suits graphs with many cycles or without any hierarchy.
+
+Connected Nodes attract each other, all Nodes repel each other
+(Fruchterman-Reingold). Repulsion is computed exactly between Nodes in
+neighbouring cells of a grid only, between far away Nodes it is
+approximated by the centers of mass of ever coarser grid cells. That
+makes an iteration roughly linear in the number of Nodes. Nodes are
+treated as rectangles of their actual size and pushed apart where they
+overlap.
+
+NumPy is an optional dependency, only needed for this layout.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .exceptions import MissingDependencyError
+
+
+ITERATIONS = 150
+# Progress is reported (and cancelling possible) after each batch.
+BATCH_SIZE = 10
+# At most this many final iterations only resolve overlaps.
+COLLISION_ITERATIONS = 50
+
+SPACING = 20
+GRAVITY = 0.01
+SEED = 0
+
+# Nodes without a known size (e.g. from serializer.loadModel()).
+DEFAULT_WIDTH = 100
+DEFAULT_HEIGHT = 50
+
+
+def forceLayout(graph, iterations=ITERATIONS, spacing=SPACING,
+                progress=None):
+    """Return the top left (x, y) position for each Node of the graph.
+
+    The optional progress(fraction) callback is called after each batch
+    of iterations.
+    """
+    if numpy is None:
+        raise MissingDependencyError(
+            "The force-directed layout needs numpy.")
+
+    numNodes = len(graph.uuids)
+    if not numNodes:
+        return []
+
+    sizes = numpy.array([(w or DEFAULT_WIDTH, h or DEFAULT_HEIGHT)
+                         for w, h in graph.sizes], dtype=float)
+    # The ideal distance between connected Nodes.
+    k = float(numpy.hypot(sizes[:, 0], sizes[:, 1]).mean()) + spacing
+    # Close Nodes repel each other exactly and may collide.
+    cellSize = max(k, float(sizes.max()) + spacing)
+
+    pairs = set()
+    for source, _, target, _ in graph.edges:
+        if source != target:
+            pairs.add((min(source, target), max(source, target)))
+    edges = numpy.array(sorted(pairs), dtype=int).reshape(-1, 2)
+
+    # Start spread over a square that fits all Nodes at the ideal
+    # distance, the same way every time.
+    random = numpy.random.RandomState(SEED)
+    side = k * numpy.sqrt(numNodes)
+    centers = random.uniform(0, side, (numNodes, 2))
+
+    totalIterations = iterations + COLLISION_ITERATIONS
+    temperature = side / 10.0
+    for i in range(iterations):
+        near = _nearPairs(centers, cellSize)
+        displacement = _repulsion(centers, near, k)
+        displacement += _farRepulsion(centers, k, cellSize)
+        displacement += _attraction(centers, edges, k)
+        displacement += GRAVITY * (centers.mean(axis=0) - centers)
+
+        # Limit the movement by the current temperature.
+        length = numpy.hypot(displacement[:, 0], displacement[:, 1])
+        scale = numpy.minimum(length, temperature) / numpy.maximum(length,
+                                                                    1e-9)
+        centers += displacement * scale[:, numpy.newaxis]
+        centers += _collisions(centers, sizes, near, spacing)
+        temperature = max(temperature * 0.95, k / 10.0)
+
+        if progress and (i + 1) % BATCH_SIZE == 0:
+            progress((i + 1.0) / totalIterations)
+
+    for i in range(COLLISION_ITERATIONS):
+        push = _collisions(centers, sizes, _nearPairs(centers, cellSize),
+                           spacing)
+        if not push.any():
+            break
+        # Crowded areas can not be resolved locally, so also make some
+        # room everywhere.
+        center = centers.mean(axis=0)
+        centers = center + (centers - center) * 1.01 + push
+    if progress:
+        progress(1.0)
+
+    topLeft = centers - sizes / 2.0
+    topLeft -= topLeft.min(axis=0)
+    return [tuple(pos) for pos in topLeft.tolist()]
+
+
+def _nearPairs(centers, cellSize):
+    """Return the index pairs (i < j) of Nodes in the same or adjacent
+    cells of a grid, as two arrays."""
+    cells = numpy.floor(centers / cellSize).astype(numpy.int64)
+    cells -= cells.min(axis=0) - 1  # Leave room for the neighbour offsets.
+    stride = int(cells[:, 1].max()) + 2
+    keys = cells[:, 0] * stride + cells[:, 1]
+
+    order = numpy.argsort(keys, kind="mergesort")
+    uniqueKeys, starts, counts = numpy.unique(
+        keys[order], return_index=True, return_counts=True)
+
+    firsts = []
+    seconds = []
+    # Half of the neighbourhood is enough, as pairs go both ways.
+    for dx, dy in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)):
+        # The cell next to each Node and its range in `order`.
+        neighbours = keys + dx * stride + dy
+        slots = numpy.minimum(numpy.searchsorted(uniqueKeys, neighbours),
+                              len(uniqueKeys) - 1)
+        found = uniqueKeys[slots] == neighbours
+        nodeCounts = numpy.where(found, counts[slots], 0)
+        total = int(nodeCounts.sum())
+        if not total:
+            continue
+        # Pair each Node with every Node of that cell.
+        first = numpy.repeat(numpy.arange(len(keys)), nodeCounts)
+        offsets = (numpy.arange(total) -
+                   numpy.repeat(numpy.cumsum(nodeCounts) - nodeCounts,
+                                nodeCounts))
+        second = order[numpy.repeat(starts[slots], nodeCounts) + offsets]
+        if (dx, dy) == (0, 0):
+            # Within the same cell, take each pair once.
+            keep = first < second
+            first = first[keep]
+            second = second[keep]
+        firsts.append(first)
+        seconds.append(second)
+
+    return numpy.concatenate(firsts), numpy.concatenate(seconds)
+
+
+def _accumulate(first, second, values, numNodes):
+    """Sum the (n, 2) values per Node, added to the first and subtracted
+    from the second Node of each pair."""
+    # Without any pairs, bincount() returns integers.
+    return numpy.stack([
+        numpy.bincount(first, weights=values[:, axis], minlength=numNodes) -
+        numpy.bincount(second, weights=values[:, axis], minlength=numNodes)
+        for axis in (0, 1)
+    ], axis=1).astype(float)
+
+
+def _repulsion(centers, near, k):
+    first, second = near
+    delta = centers[first] - centers[second]
+    distance = numpy.maximum(numpy.hypot(delta[:, 0], delta[:, 1]), 1e-3)
+    force = k * k / distance
+    return _accumulate(first, second,
+                       delta * (force / distance)[:, numpy.newaxis],
+                       len(centers))
+
+
+# The offsets from a cell to the children of its parent's neighbours,
+# without the cell itself and its neighbours. Which those are depends on
+# whether the cell's row and column are even or odd.
+_FAR_OFFSETS = [[(dx, dy) for dx in range(-2 - px, 4 - px)
+                 for dy in range(-2 - py, 4 - py)
+                 if abs(dx) > 1 or abs(dy) > 1]
+                for px in (0, 1) for py in (0, 1)]
+
+
+def _farRepulsion(centers, k, cellSize):
+    """Approximate the repulsion by Nodes that are not close.
+
+    Starting with the grid of _nearPairs(), the cells are merged 2x2
+    into ever coarser grids. At each level, all Nodes of a cell are
+    pushed the same way, by the centers of mass of the cells that are
+    not next to it but are children of its parent's neighbours. So each
+    pair of Nodes that is not in adjacent cells of the finest grid is
+    counted exactly once, in cells of about their distance.
+    """
+    offsets = numpy.array(_FAR_OFFSETS)
+    displacement = numpy.zeros_like(centers)
+    cells = numpy.floor(centers / cellSize).astype(numpy.int64)
+    cells -= cells.min(axis=0)
+    while True:
+        extent = cells.max(axis=0)
+        if extent.max() <= 1:
+            # All cells are next to each other.
+            break
+        # Leave room for the offsets, so that keys do not wrap around.
+        stride = int(extent[1]) + 7
+        keys = (cells[:, 0] + 3) * stride + cells[:, 1] + 3
+        uniqueKeys, first, inverse, counts = numpy.unique(
+            keys, return_index=True, return_inverse=True,
+            return_counts=True)
+        inverse = inverse.reshape(-1)
+        masses = numpy.stack([
+            numpy.bincount(inverse, weights=centers[:, axis]) / counts
+            for axis in (0, 1)
+        ], axis=1)
+
+        # Pairs of a cell and each cell it is pushed by.
+        parity = cells[first] % 2
+        keyOffsets = (offsets[:, :, 0] * stride + offsets[:, :, 1])[
+            parity[:, 0] * 2 + parity[:, 1]]
+        otherKeys = (uniqueKeys[:, numpy.newaxis] + keyOffsets).reshape(-1)
+        cellIds = numpy.repeat(numpy.arange(len(uniqueKeys)),
+                               offsets.shape[1])
+        slots = numpy.minimum(numpy.searchsorted(uniqueKeys, otherKeys),
+                              len(uniqueKeys) - 1)
+        found = uniqueKeys[slots] == otherKeys
+        cellIds = cellIds[found]
+        slots = slots[found]
+
+        delta = masses[cellIds] - masses[slots]
+        distance = numpy.maximum(numpy.hypot(delta[:, 0], delta[:, 1]), 1e-3)
+        force = counts[slots] * k * k / distance
+        push = delta * (force / distance)[:, numpy.newaxis]
+        push = numpy.stack([
+            numpy.bincount(cellIds, weights=push[:, axis],
+                           minlength=len(uniqueKeys))
+            for axis in (0, 1)
+        ], axis=1)
+        displacement += push[inverse]
+        cells //= 2
+    return displacement
+
+
+def _attraction(centers, edges, k):
+    if not len(edges):
+        return numpy.zeros_like(centers)
+    delta = centers[edges[:, 0]] - centers[edges[:, 1]]
+    distance = numpy.maximum(numpy.hypot(delta[:, 0], delta[:, 1]), 1e-3)
+    pull = delta * (distance / k)[:, numpy.newaxis]
+    return -_accumulate(edges[:, 0], edges[:, 1], pull, len(centers))
+
+
+def _collisions(centers, sizes, near, spacing):
+    """Return how to move the Nodes so that their rectangles (plus
+    spacing) do not overlap, along the axis that needs the least."""
+    first, second = near
+    delta = centers[first] - centers[second]
+    overlap = ((sizes[first] + sizes[second]) / 2.0 + spacing -
+               numpy.abs(delta))
+    colliding = (overlap[:, 0] > 0) & (overlap[:, 1] > 0)
+    if not colliding.any():
+        return numpy.zeros_like(centers)
+
+    first = first[colliding]
+    second = second[colliding]
+    delta = delta[colliding]
+    overlap = overlap[colliding]
+    alongX = overlap[:, 0] < overlap[:, 1]
+    # Nodes on the same spot are told apart by their index, so they do
+    # not stay stuck.
+    tie = numpy.where(first > second, 1.0, -1.0)[:, numpy.newaxis]
+    direction = numpy.where(delta > 0, 1.0,
+                            numpy.where(delta < 0, -1.0, tie))
+
+    push = numpy.zeros_like(delta)
+    # Each Node of a pair moves half of the way.
+    push[alongX, 0] = (overlap[alongX, 0] / 2.0) * direction[alongX, 0]
+    push[~alongX, 1] = (overlap[~alongX, 1] / 2.0) * direction[~alongX, 1]
+    return _accumulate(first, second, push, len(centers))
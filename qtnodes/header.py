@@ -3,7 +3,8 @@
 from PySide import QtGui
 from PySide import QtCore
 
-from .helpers import getTextSize
+from .helpers import (getTextSize, getLevelOfDetail,
+                      LOD_MINIMAL, LOD_REDUCED)
 
 
 class Header(QtGui.QGraphicsItem):
@@ -19,6 +20,18 @@ class Header(QtGui.QGraphicsItem):
         self.fillColor = QtGui.QColor(90, 90, 90)
         self.textColor = QtGui.QColor(240, 240, 240)
 
+        # The laid out label as (key, QStaticText, position), see _getLabel().
+        self._label = None
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        self._text = value
+        self.update()
+
     def boundingRect(self):
         nodebox = self.node.boundingRect()
         rect = QtCore.QRect(self.x(),
@@ -28,11 +41,18 @@ class Header(QtGui.QGraphicsItem):
         return rect
 
     def paint(self, painter, option, widget):
+        lod = getLevelOfDetail(painter, option)
+        if lod == LOD_MINIMAL:
+            return
+
         # Draw background rectangle.
         bbox = self.boundingRect()
 
         painter.setPen(QtGui.QPen(QtCore.Qt.NoPen))
         painter.setBrush(self.fillColor)
+        if lod == LOD_REDUCED:
+            painter.drawRect(bbox)
+            return
         painter.drawRoundedRect(bbox,
                                 self.node.roundness,
                                 self.node.roundness)
@@ -50,10 +70,32 @@ class Header(QtGui.QGraphicsItem):
         #                  self.text)
 
         # left aligned text
+        _, label, pos = self._getLabel(painter)
+        painter.drawStaticText(pos, label)
+
+    def _getLabel(self, painter):
+        """Return the laid out label as (key, QStaticText, position).
+
+        The layout is only redone if the text, font or geometry changes.
+        """
+        font = painter.font()
+        key = (self.text, font.key(), self.x(), self.y(),
+               self.h, self.node.margin)
+        if self._label is not None and self._label[0] == key:
+            return self._label
+
         textSize = getTextSize(self.text, painter=painter)
-        painter.drawText(self.x() + self.node.margin,
-                         self.y() + (self.h + textSize.height() / 2) / 2,
-                         self.text)
+        x = self.x() + self.node.margin
+        baseline = self.y() + (self.h + textSize.height() / 2) / 2
+        # Static text is placed by its top, not its baseline.
+        y = baseline - painter.fontMetrics().ascent()
+
+        label = QtGui.QStaticText(self.text)
+        label.setPerformanceHint(QtGui.QStaticText.AggressiveCaching)
+        label.prepare(QtGui.QTransform(), font)
+
+        self._label = (key, label, QtCore.QPointF(x, y))
+        return self._label
 
     def destroy(self):
         """Remove this object from the scene and delete it."""
@@ -1,25 +1,41 @@
 """Various helper functions."""
 
-import json
+import collections
 
 from PySide import QtGui
 from PySide import QtCore
 
+# Moved to fileio.py, so they can be used without Qt.
+from .fileio import (readFileContent, toJson, fromJson,  # noqa
+                     replaceFile)
 
-def readFileContent(filePath):
-    """Return the content of the file."""
-    with open(filePath) as f:
-        return f.read()
 
+# Measured text sizes by (font key, text), least recently used first.
+TEXT_SIZE_CACHE_LIMIT = 4096
+_textSizeCache = collections.OrderedDict()
 
-def toJson(serialized):
-    """Return JSON string from given native Python datatypes."""
-    return json.dumps(serialized, encoding="utf-8", indent=4)
+# Metrics for the application's default font as (font key, QFontMetrics).
+_defaultMetrics = None
 
 
-def fromJson(jsonString):
-    """Return native Python datatypes from JSON string."""
-    return json.loads(jsonString, encoding="utf-8")
+def _getDefaultMetrics():
+    """Return the shared font key and metrics for the default font.
+
+    They are renewed if the application font has changed.
+    """
+    global _defaultMetrics
+    font = QtGui.QFont()
+    fontKey = font.key()
+    if _defaultMetrics is None or _defaultMetrics[0] != fontKey:
+        _defaultMetrics = (fontKey, QtGui.QFontMetrics(font))
+    return _defaultMetrics
+
+
+def clearTextSizeCache():
+    """Forget all sizes measured by getTextSize()."""
+    global _defaultMetrics
+    _textSizeCache.clear()
+    _defaultMetrics = None
 
 
 def getTextSize(text, painter=None):
@@ -27,10 +43,44 @@ def getTextSize(text, painter=None):
 
     If no painter is supplied, the font metrics are based on a default
     QPainter, which may be off depending on the font und text size used.
+
+    Sizes are cached per font and text. Since the font is part of the
+    key, changing the (application) font does not return stale sizes.
     """
     if not painter:
-        metrics = QtGui.QFontMetrics(QtGui.QFont())
+        fontKey, metrics = _getDefaultMetrics()
     else:
-        metrics = painter.fontMetrics()
-    size = metrics.size(QtCore.Qt.TextSingleLine, text)
-    return size
+        fontKey, metrics = painter.font().key(), None
+
+    key = (fontKey, text)
+    try:
+        width, height = _textSizeCache.pop(key)
+    except KeyError:
+        if metrics is None:
+            metrics = painter.fontMetrics()
+        size = metrics.size(QtCore.Qt.TextSingleLine, text)
+        width, height = size.width(), size.height()
+        if len(_textSizeCache) >= TEXT_SIZE_CACHE_LIMIT:
+            _textSizeCache.popitem(last=False)
+    _textSizeCache[key] = (width, height)
+    return QtCore.QSize(width, height)
+
+
+# Level of detail tiers for painting items, see getLevelOfDetail().
+LOD_MINIMAL = 0  # Nodes as points, only straight Edges.
+LOD_REDUCED = 1  # Plain shapes, no labels, straight Edges.
+LOD_FULL = 2
+
+# The zoom levels below which the tiers apply. Adjust as needed.
+LOD_REDUCED_BELOW = 0.5
+LOD_MINIMAL_BELOW = 0.2
+
+
+def getLevelOfDetail(painter, option):
+    """Return the LOD_* tier to paint an item with, based on the zoom."""
+    zoom = option.levelOfDetailFromTransform(painter.worldTransform())
+    if zoom < LOD_MINIMAL_BELOW:
+        return LOD_MINIMAL
+    if zoom < LOD_REDUCED_BELOW:
+        return LOD_REDUCED
+    return LOD_FULL
@@ -3,9 +3,11 @@
 from PySide import QtGui
 from PySide import QtCore
 
-from .helpers import getTextSize
+from .helpers import (getTextSize, getLevelOfDetail,
+                      LOD_MINIMAL, LOD_REDUCED)
 from .exceptions import KnobConnectionError, UnknownFlowError
 from .edge import Edge
+from .scene import GraphScene
 
 
 # Currently only affects Knob label placement.
@@ -24,12 +26,12 @@ class Knob(QtGui.QGraphicsItem):
         self.h = 10
 
         self.margin = 5
-        self.flow = FLOW_LEFT_TO_RIGHT
+        self._flow = FLOW_LEFT_TO_RIGHT
 
         self.maxConnections = -1  # A negative value means 'unlimited'.
 
         self.name = "value"
-        self.displayName = self.name
+        self._displayName = self.name
 
         self.labelColor = QtGui.QColor(10, 10, 10)
         self.fillColor = QtGui.QColor(130, 130, 130)
@@ -38,10 +40,33 @@ class Knob(QtGui.QGraphicsItem):
         # Temp store for Edge currently being created.
         self.newEdge = None
 
+        # The laid out label as (key, QStaticText, position), see _getLabel().
+        self._label = None
+
         self.edges = []
 
         self.setAcceptHoverEvents(True)
 
+    @property
+    def displayName(self):
+        return self._displayName
+
+    @displayName.setter
+    def displayName(self, value):
+        # The label is part of our bounding rect.
+        self.prepareGeometryChange()
+        self._displayName = value
+
+    @property
+    def flow(self):
+        return self._flow
+
+    @flow.setter
+    def flow(self, value):
+        # The flow decides on which side the label is drawn.
+        self.prepareGeometryChange()
+        self._flow = value
+
     def node(self):
         """The Node that this Knob belongs to is its parent item."""
         return self.parentItem()
@@ -52,20 +77,83 @@ class Knob(QtGui.QGraphicsItem):
         This creates an Edge and directly connects it, in contrast to the mouse
         events that first create an Edge temporarily and only connect if the 
         user releases on a valid target Knob.
+
+        The same rules apply as for the mouse events, see validateConnection(),
+        except that connecting a Knob to itself does nothing.
         """
         if knob is self:
             return
 
-        self.checkMaxConnections(knob)
+        self.validateConnection(knob)
 
         edge = Edge()
         edge.source = self
         edge.target = knob
+        self.finalizeEdge(edge)
 
         self.addEdge(edge)
         knob.addEdge(edge)
+        edge.register()
+
+        scene = self.scene()
+        if isinstance(scene, GraphScene):
+            scene.updateEdgePath(edge)
+        else:
+            edge.updatePath()
+
+    def _model(self):
+        """Return the GraphModel our Node is registered in, None otherwise."""
+        node = self.node()
+        if node is None or node.record is None:
+            return None
+        return self.scene().model
+
+    def connectionCount(self):
+        """Return the number of Edges connecting this Knob to other Knobs."""
+        model = self._model()
+        if model is not None:
+            return model.knobDegree(self.node().record, self.name)
+        # Not registered, so there is no index to ask. Skip the Edge
+        # that may currently be created by the user.
+        return len([e for e in self.edges if e.source and e.target])
+
+    def isConnectedTo(self, knob):
+        """Return True if there already is an Edge between the two Knobs."""
+        if isinstance(knob, OutputKnob):
+            source, target = knob, self
+        else:
+            source, target = self, knob
+        model = self._model()
+        if model is not None and target._model() is model:
+            return model.isConnected(source.node().record, source.name,
+                                     target.node().record, target.name)
+        for edge in self.edges:
+            if set([edge.source, edge.target]) == set([self, knob]):
+                return True
+        return False
+
+    def validateConnection(self, knob):
+        """Check if this Knob may be connected to the given one.
+
+        Raise a KnobConnectionError if not.
+        """
+        if knob is self:
+            raise KnobConnectionError(
+                "Can't connect a Knob to itself.")
 
-        edge.updatePath()
+        if not isinstance(knob, Knob):
+            raise KnobConnectionError(
+                "Can only connect to other Knobs.")
+
+        if type(self) == type(knob):
+            raise KnobConnectionError(
+                "Can't connect Knobs of same type.")
+
+        if self.isConnectedTo(knob):
+            raise KnobConnectionError(
+                "Connection already exists.")
+
+        self.checkMaxConnections(knob)
 
     def addEdge(self, edge):
         """Add the given Edge to the internal tracking list.
@@ -78,7 +166,7 @@ class Knob(QtGui.QGraphicsItem):
         """
         self.edges.append(edge)
         scene = self.scene()
-        if edge not in scene.items():
+        if edge.scene() is not scene:
             scene.addItem(edge)
 
     def removeEdge(self, edge):
@@ -88,17 +176,43 @@ class Knob(QtGui.QGraphicsItem):
         """
         self.edges.remove(edge)
         scene = self.scene()
-        if edge in scene.items():
+        if edge.scene() is scene:
             scene.removeItem(edge)
 
-    def boundingRect(self):
-        """Return the bounding box of this Knob."""
+    def rect(self):
+        """Return the Knob's rectangle, which is what can be interacted
+        with and where Edges are attached."""
         rect = QtCore.QRect(self.x,
                             self.y,
                             self.w,
                             self.h)
         return rect
 
+    def labelRect(self):
+        """Return the area covered by the label next to the rectangle."""
+        rect = self.rect()
+        textSize = getTextSize(self.displayName)
+        if self.flow == FLOW_LEFT_TO_RIGHT:
+            x = rect.right() + self.margin
+        elif self.flow == FLOW_RIGHT_TO_LEFT:
+            x = rect.left() - self.margin - textSize.width()
+        else:
+            return QtCore.QRectF()
+        # The label's baseline is at the bottom of the rectangle, leave
+        # some room for descenders.
+        return QtCore.QRectF(x, rect.bottom() - textSize.height(),
+                             textSize.width(), textSize.height() * 1.5)
+
+    def boundingRect(self):
+        """Return the bounding box of this Knob, including its label."""
+        return QtCore.QRectF(self.rect()).united(self.labelRect())
+
+    def shape(self):
+        """Only the rectangle reacts to the mouse, not the label."""
+        path = QtGui.QPainterPath()
+        path.addRect(self.rect())
+        return path
+
     def highlight(self, toggle):
         """Toggle the highlight color on/off.
         
@@ -109,17 +223,45 @@ class Knob(QtGui.QGraphicsItem):
             self.fillColor = self.highlightColor
         else:
             self.fillColor = self._oldFillColor
+        self.update()
 
     def paint(self, painter, option, widget):
-        """Draw the Knob's shape and label."""
-        bbox = self.boundingRect()
+        """Draw the Knob's shape and label.
+
+        The label is skipped when zoomed out, see getLevelOfDetail().
+        """
+        lod = getLevelOfDetail(painter, option)
+        if lod == LOD_MINIMAL:
+            return
+
+        bbox = self.rect()
 
         # Draw a filled rectangle.
         painter.setPen(QtGui.QPen(QtCore.Qt.NoPen))
         painter.setBrush(QtGui.QBrush(self.fillColor))
         painter.drawRect(bbox)
+        if lod == LOD_REDUCED:
+            return
+
+        # Draw a text label next to it.
+        _, label, pos = self._getLabel(painter)
+        painter.setPen(QtGui.QPen(self.labelColor))
+        painter.drawStaticText(pos, label)
+
+    def _getLabel(self, painter):
+        """Return the laid out label as (key, QStaticText, position).
 
-        # Draw a text label next to it. Position depends on the flow.
+        The layout is only redone if the text, flow, font or our geometry
+        changes. Colors are applied when drawing and do not affect it.
+        """
+        font = painter.font()
+        key = (self.displayName, self.flow, font.key(),
+               self.x, self.y, self.w, self.h, self.margin)
+        if self._label is not None and self._label[0] == key:
+            return self._label
+
+        # Position depends on the flow.
+        bbox = self.rect()
         textSize = getTextSize(self.displayName, painter=painter)
         if self.flow == FLOW_LEFT_TO_RIGHT:
             x = bbox.right() + self.margin
@@ -128,10 +270,15 @@ class Knob(QtGui.QGraphicsItem):
         else:
             raise UnknownFlowError(
                 "Flow not recognized: {0}".format(self.flow))
-        y = bbox.bottom()
+        # Static text is placed by its top, not its baseline.
+        y = bbox.bottom() - painter.fontMetrics().ascent()
 
-        painter.setPen(QtGui.QPen(self.labelColor))
-        painter.drawText(x, y, self.displayName)
+        label = QtGui.QStaticText(self.displayName)
+        label.setPerformanceHint(QtGui.QStaticText.AggressiveCaching)
+        label.prepare(QtGui.QTransform(), font)
+
+        self._label = (key, label, QtCore.QPointF(x, y))
+        return self._label
 
     def hoverEnterEvent(self, event):
         """Change the Knob's rectangle color."""
@@ -167,9 +314,8 @@ class Knob(QtGui.QGraphicsItem):
     def mouseReleaseEvent(self, event):
         """Finish Edge creation (if validations are passed).
 
-        TODO: This currently implements some constraints regarding the Knob
-          connection logic, for which we should probably have a more
-          flexible approach.
+        The constraints are the same as for connectTo(), see
+        validateConnection().
         """
         if event.button() == QtCore.Qt.MouseButton.LeftButton:
 
@@ -180,32 +326,16 @@ class Knob(QtGui.QGraphicsItem):
             try:
                 if self.newEdge and target:
 
-                    if self.newEdge.source is target:
-                        raise KnobConnectionError(
-                            "Can't connect a Knob to itself.")
-
                     if isinstance(target, Knob):
 
-                        if type(self) == type(target):
-                            raise KnobConnectionError(
-                                "Can't connect Knobs of same type.")
-
-                        newConn = set([self, target])
-                        for edge in self.edges:
-                            existingConn = set([edge.source, edge.target])
-                            diff = existingConn.difference(newConn)
-                            if not diff:
-                                raise KnobConnectionError(
-                                    "Connection already exists.")
-                                return
-
-                        self.checkMaxConnections(target)
+                        self.validateConnection(target)
 
                         print("finish edge")
                         target.addEdge(self.newEdge)
                         self.newEdge.target = target
                         self.newEdge.updatePath()
                         self.finalizeEdge(self.newEdge)
+                        self.newEdge.register()
                         self.newEdge = None
                         return
 
@@ -223,21 +353,12 @@ class Knob(QtGui.QGraphicsItem):
 
         Raise a KnobConnectionError if not.
         """
-        noLimits = self.maxConnections < 0 and knob.maxConnections < 0
-        if noLimits:
-            return
-
-        numSourceConnections = len(self.edges)  # Edge already added.
-        numTargetConnections = len(knob.edges) + 1
-
-        print(numSourceConnections, numTargetConnections)
-
-        sourceMaxReached = numSourceConnections > self.maxConnections
-        targetMaxReached = numTargetConnections > knob.maxConnections
-
-        if sourceMaxReached or targetMaxReached:
-            raise KnobConnectionError(
-                "Maximum number of connections reached.")
+        for k in (self, knob):
+            if k.maxConnections < 0:
+                continue
+            if k.connectionCount() >= k.maxConnections:
+                raise KnobConnectionError(
+                    "Maximum number of connections reached.")
 
     def finalizeEdge(self, edge):
         """This intentionally is a NoOp on the Knob baseclass.
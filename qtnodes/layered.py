@@ -0,0 +1,412 @@
+"""Layered (Sugiyama style) graph layout in pure Python.
+
+Data flows from left to right: A Node is placed in a layer right of all
+Nodes feeding its inputs. The layout is done in these steps:
+
+1. Cycle removal: Edges closing a cycle are reversed for the time being.
+2. Layer assignment: Longest path from the sources, then sources are
+   pulled right next to the Nodes they feed.
+3. Edges spanning several layers are split up by dummy vertices.
+4. Crossing reduction: Barycenter sweeps over the layers, taking the
+   order of the Knobs within their Nodes into account.
+5. Coordinate assignment: Each layer is as wide as its widest Node,
+   within a layer Nodes are moved close to the Knobs they connect to.
+
+Unconnected parts of the graph are laid out separately and stacked.
+
+This works on a layout.LayoutGraph and does not need Qt or graphviz.
+"""
+
+LAYER_SPACING = 80
+NODE_SPACING = 20
+COMPONENT_SPACING = 60
+
+# Nodes without a known size (e.g. from serializer.loadModel()).
+DEFAULT_WIDTH = 100
+DEFAULT_HEIGHT = 50
+
+CROSSING_SWEEPS = 8
+PLACEMENT_SWEEPS = 4
+
+
+def layeredLayout(graph, layerSpacing=LAYER_SPACING,
+                  nodeSpacing=NODE_SPACING,
+                  componentSpacing=COMPONENT_SPACING,
+                  progress=None):
+    """Return the top left (x, y) position for each Node of the graph.
+
+    The optional progress(fraction) callback is called after each step.
+    """
+    numNodes = len(graph.uuids)
+    sizes = [(w or DEFAULT_WIDTH, h or DEFAULT_HEIGHT)
+             for w, h in graph.sizes]
+
+    # Relative Knob positions: The n-th of k Knobs is at (n + 1) / (k + 1)
+    # of the Node's height.
+    inputFractions = [_knobFractions(knobs) for knobs in graph.inputs]
+    outputFractions = [_knobFractions(knobs) for knobs in graph.outputs]
+
+    edges = []
+    for source, sourceKnob, target, targetKnob in graph.edges:
+        if source == target:
+            continue
+        edges.append((source, outputFractions[source].get(sourceKnob, 0.5),
+                      target, inputFractions[target].get(targetKnob, 0.5)))
+
+    positions = [None] * numNodes
+    top = 0.0
+    done = [0]
+
+    def report(fraction, size):
+        if progress:
+            progress((done[0] + fraction * size) / float(max(numNodes, 1)))
+
+    for nodes, componentEdges in _components(numNodes, edges):
+        component = _Component(nodes, componentEdges, sizes,
+                               layerSpacing, nodeSpacing)
+        layout = component.layout(
+            lambda fraction, size=len(nodes): report(fraction, size))
+        done[0] += len(nodes)
+        height = 0.0
+        for node, (x, y) in layout.items():
+            positions[node] = (x, top + y)
+            height = max(height, y + sizes[node][1])
+        top += height + componentSpacing
+    return positions
+
+
+def _knobFractions(knobs):
+    count = len(knobs)
+    return dict((name, (i + 1.0) / (count + 1.0))
+                for i, name in enumerate(knobs))
+
+
+def _components(numNodes, edges):
+    """Yield (nodes, edges) for each connected part of the graph."""
+    parents = list(range(numNodes))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for edge in edges:
+        a, b = find(edge[0]), find(edge[2])
+        if a != b:
+            parents[max(a, b)] = min(a, b)
+
+    nodesByRoot = {}
+    edgesByRoot = {}
+    for node in range(numNodes):
+        nodesByRoot.setdefault(find(node), []).append(node)
+    for edge in edges:
+        edgesByRoot.setdefault(find(edge[0]), []).append(edge)
+
+    for root in sorted(nodesByRoot):
+        yield nodesByRoot[root], edgesByRoot.get(root, [])
+
+
+def _isotonic(values):
+    """Return the non-decreasing sequence closest to the given values.
+
+    Pool adjacent violators, in the least squares sense.
+    """
+    blocks = []  # [sum, count]
+    for value in values:
+        blocks.append([value, 1])
+        while (len(blocks) > 1 and
+               blocks[-2][0] * blocks[-1][1] > blocks[-1][0] * blocks[-2][1]):
+            total, count = blocks.pop()
+            blocks[-1][0] += total
+            blocks[-1][1] += count
+    result = []
+    for total, count in blocks:
+        result.extend([total / float(count)] * count)
+    return result
+
+
+def _countCrossings(segments):
+    """Count the crossings of the segments between two adjacent layers.
+
+    The segments are (upper position, lower position) pairs.
+    """
+    if len(segments) < 2:
+        return 0
+    segments = sorted(segments)
+    ranks = dict((p, i + 1) for i, p in
+                 enumerate(sorted(set(s[1] for s in segments))))
+    # Count the inversions in the lower positions with a Fenwick tree.
+    tree = [0] * (len(ranks) + 1)
+    crossings = 0
+    for seen, (_, lower) in enumerate(segments):
+        rank = ranks[lower]
+        i = rank
+        notGreater = 0
+        while i > 0:
+            notGreater += tree[i]
+            i -= i & -i
+        crossings += seen - notGreater
+        i = rank
+        while i < len(tree):
+            tree[i] += 1
+            i += i & -i
+    return crossings
+
+
+class _Component(object):
+    """The layout of one connected part of the graph.
+
+    Vertices are the Component's Nodes (numbered in order) followed by
+    the dummy vertices of long Edges.
+    """
+
+    def __init__(self, nodes, edges, sizes, layerSpacing, nodeSpacing):
+        self.nodes = nodes
+        self.layerSpacing = layerSpacing
+        self.nodeSpacing = nodeSpacing
+
+        local = dict((node, i) for i, node in enumerate(nodes))
+        self.widths = [sizes[node][0] for node in nodes]
+        self.heights = [sizes[node][1] for node in nodes]
+        self.edges = [(local[a], fa, local[b], fb) for a, fa, b, fb in edges]
+
+    def layout(self, progress):
+        """Return {node: (x, y)}, relative to the Component's top left."""
+        edges = self._removeCycles(len(self.nodes), self.edges)
+        layerOf = self._assignLayers(len(self.nodes), edges)
+        self._splitLongEdges(layerOf, edges)
+        progress(0.2)
+        self._reduceCrossings(
+            lambda fraction: progress(0.2 + 0.5 * fraction))
+        positions = self._assignCoordinates(
+            lambda fraction: progress(0.7 + 0.3 * fraction))
+        progress(1.0)
+        return positions
+
+    @staticmethod
+    def _removeCycles(numNodes, edges):
+        """Return the edges with those reversed that close a cycle."""
+        successors = [[] for _ in range(numNodes)]
+        for i, edge in enumerate(edges):
+            successors[edge[0]].append((edge[2], i))
+
+        # Iterative depth first search, an Edge to a vertex that is still
+        # on the stack closes a cycle.
+        reverse = set()
+        state = [0] * numNodes  # 0: new, 1: on stack, 2: done.
+        for start in range(numNodes):
+            if state[start]:
+                continue
+            state[start] = 1
+            stack = [(start, iter(successors[start]))]
+            while stack:
+                vertex, todo = stack[-1]
+                for successor, edgeIndex in todo:
+                    if state[successor] == 1:
+                        reverse.add(edgeIndex)
+                    elif state[successor] == 0:
+                        state[successor] = 1
+                        stack.append((successor, iter(successors[successor])))
+                        break
+                else:
+                    state[vertex] = 2
+                    stack.pop()
+
+        result = []
+        for i, (a, fa, b, fb) in enumerate(edges):
+            if i in reverse:
+                result.append((b, fb, a, fa))
+            else:
+                result.append((a, fa, b, fb))
+        return result
+
+    @staticmethod
+    def _assignLayers(numNodes, edges):
+        """Return the layer index of each vertex of the acyclic graph."""
+        successors = [[] for _ in range(numNodes)]
+        numPredecessors = [0] * numNodes
+        for a, _, b, _ in edges:
+            successors[a].append(b)
+            numPredecessors[b] += 1
+
+        # Longest path, in topological order.
+        order = [v for v in range(numNodes) if not numPredecessors[v]]
+        layerOf = [0] * numNodes
+        for vertex in order:
+            for successor in successors[vertex]:
+                layerOf[successor] = max(layerOf[successor],
+                                         layerOf[vertex] + 1)
+                numPredecessors[successor] -= 1
+                if not numPredecessors[successor]:
+                    order.append(successor)
+
+        # Sources would all end up in the first layer, move them as close
+        # as possible to the Nodes they feed instead.
+        hasPredecessors = set(b for _, _, b, _ in edges)
+        for vertex in reversed(order):
+            if vertex not in hasPredecessors and successors[vertex]:
+                layerOf[vertex] = min(
+                    layerOf[s] for s in successors[vertex]) - 1
+        lowest = min(layerOf) if layerOf else 0
+        return [layer - lowest for layer in layerOf]
+
+    def _splitLongEdges(self, layerOf, edges):
+        """Build the layers, predecessors and successors of all vertices.
+
+        Edges are replaced by segments between adjacent layers, as
+        (vertex, its Knob fraction, other vertex, its Knob fraction).
+        """
+        self.layerOf = list(layerOf)
+        self.predecessors = [[] for _ in layerOf]
+        self.successors = [[] for _ in layerOf]
+
+        def addVertex(layer):
+            self.layerOf.append(layer)
+            self.widths.append(0)
+            self.heights.append(0)
+            self.predecessors.append([])
+            self.successors.append([])
+            return len(self.layerOf) - 1
+
+        for a, fa, b, fb in edges:
+            previous, previousFraction = a, fa
+            for layer in range(self.layerOf[a] + 1, self.layerOf[b]):
+                dummy = addVertex(layer)
+                self._addSegment(previous, previousFraction, dummy, 0.5)
+                previous, previousFraction = dummy, 0.5
+            self._addSegment(previous, previousFraction, b, fb)
+
+        self.layers = [[] for _ in range(max(self.layerOf) + 1)]
+        for vertex in self._initialOrder():
+            self.layers[self.layerOf[vertex]].append(vertex)
+
+    def _addSegment(self, a, fa, b, fb):
+        self.successors[a].append((b, fb, fa))
+        self.predecessors[b].append((a, fa, fb))
+
+    def _initialOrder(self):
+        """Return all vertices in depth first order, so that connected
+        vertices start out close to each other."""
+        seen = set()
+        order = []
+        for start in range(len(self.layerOf)):
+            if start in seen:
+                continue
+            seen.add(start)
+            stack = [start]
+            while stack:
+                vertex = stack.pop()
+                order.append(vertex)
+                neighbours = ([s[0] for s in self.successors[vertex]] +
+                              [p[0] for p in self.predecessors[vertex]])
+                for neighbour in reversed(neighbours):
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        stack.append(neighbour)
+        return order
+
+    def _sortLayer(self, layer, position, neighboursOf):
+        """Sort the layer by the barycenters of the vertices' neighbours.
+
+        Vertices without neighbours on that side keep their position.
+        """
+        keys = {}
+        for vertex in layer:
+            neighbours = neighboursOf[vertex]
+            if neighbours:
+                total = sum(position[n] + fn for n, fn, _ in neighbours)
+                keys[vertex] = total / float(len(neighbours))
+            else:
+                keys[vertex] = position[vertex] + 0.5
+        layer.sort(key=lambda v: keys[v])
+        for i, vertex in enumerate(layer):
+            position[vertex] = i
+
+    def _crossings(self, position):
+        crossings = 0
+        for layer in self.layers[:-1]:
+            segments = []
+            for vertex in layer:
+                for successor, fs, fv in self.successors[vertex]:
+                    segments.append((position[vertex] + fv,
+                                     position[successor] + fs))
+            crossings += _countCrossings(segments)
+        return crossings
+
+    def _reduceCrossings(self, progress):
+        position = [0] * len(self.layerOf)
+        for layer in self.layers:
+            for i, vertex in enumerate(layer):
+                position[vertex] = i
+
+        best = [list(layer) for layer in self.layers]
+        bestCrossings = self._crossings(position)
+        for sweep in range(CROSSING_SWEEPS):
+            if not bestCrossings:
+                break
+            progress(sweep / float(CROSSING_SWEEPS))
+            for layer in self.layers[1:]:
+                self._sortLayer(layer, position, self.predecessors)
+            for layer in reversed(self.layers[:-1]):
+                self._sortLayer(layer, position, self.successors)
+            crossings = self._crossings(position)
+            if crossings < bestCrossings:
+                best = [list(layer) for layer in self.layers]
+                bestCrossings = crossings
+        self.layers = best
+
+    def _placeLayer(self, layer, top, neighboursOfs):
+        """Move the vertices close to the Knobs they are connected to,
+        without overlaps and keeping their order."""
+        desired = []
+        offsets = []
+        offset = 0.0
+        for vertex in layer:
+            height = self.heights[vertex]
+            wanted = []
+            for neighboursOf in neighboursOfs:
+                for n, fn, fv in neighboursOf[vertex]:
+                    wanted.append(top[n] + fn * self.heights[n] - fv * height)
+            if wanted:
+                desired.append(sum(wanted) / len(wanted) - offset)
+            else:
+                desired.append(top[vertex] - offset)
+            offsets.append(offset)
+            offset += height + self.nodeSpacing
+
+        for vertex, value, offset in zip(layer, _isotonic(desired), offsets):
+            top[vertex] = value + offset
+
+    def _assignCoordinates(self, progress):
+        # Start with the layers stacked from the top.
+        top = [0.0] * len(self.layerOf)
+        for layer in self.layers:
+            y = 0.0
+            for vertex in layer:
+                top[vertex] = y
+                y += self.heights[vertex] + self.nodeSpacing
+
+        for sweep in range(PLACEMENT_SWEEPS):
+            progress(sweep / float(PLACEMENT_SWEEPS))
+            for layer in self.layers[1:]:
+                self._placeLayer(layer, top, [self.predecessors])
+            for layer in reversed(self.layers[:-1]):
+                self._placeLayer(layer, top, [self.successors])
+        for layer in self.layers:
+            self._placeLayer(layer, top,
+                             [self.predecessors, self.successors])
+
+        layerX = []
+        x = 0.0
+        for layer in self.layers:
+            layerX.append(x)
+            x += max(self.widths[v] for v in layer) + self.layerSpacing
+
+        numNodes = len(self.nodes)
+        minTop = min(top[:numNodes])
+        positions = {}
+        for vertex, node in enumerate(self.nodes):
+            positions[node] = (layerX[self.layerOf[vertex]],
+                               top[vertex] - minTop)
+        return positions
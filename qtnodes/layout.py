@@ -1,144 +1,291 @@
 """Automatic tree layouting."""
 import os
 import re
+import tempfile
 
-from .node import Node
+from . import layered
+from . import forcelayout
+from .layered import (layeredLayout, LAYER_SPACING, NODE_SPACING,
+                      DEFAULT_WIDTH, DEFAULT_HEIGHT)
+from .layoutcache import topologyKey
+from .exceptions import UnknownLayoutEngineError
 
-# Need to have graphviz installed (its bin/ must be on PATH).
-import pydot
-import appdirs
 
+# The built-in layered layout, see layered.py.
+ENGINE_NATIVE = "native"
+# graphviz' dot, needs pydot and graphviz (its bin/ must be on PATH).
+ENGINE_DOT = "dot"
+# Force-directed, for graphs without hierarchy, see forcelayout.py.
+ENGINE_FORCE = "force"
 
-class Tree(object):
-    """A wrapper for each Node, solely for layouting purposes."""
 
-    def __init__(self, node):
-        self.node = node
-        self.parents = []
-        self.children = []
+class LayoutGraph(object):
+    """A snapshot of what layouting needs to know about a GraphModel.
 
+    This is plain data only, Nodes are referred to by their index.
+    Edges are (source index, source Knob, target index, target Knob).
+    """
 
-def _getNodesFromScene(scene):
-    """Return all Node items of the given QGraphicsScene."""
-    nodes = [i for i in scene.items() if isinstance(i, Node)]
-    return nodes
-
-
-def _makeTree(nodes):
-    """Return a list of Trees that represent the Node hierarchy."""
-    node2tree = {}
-    for node in nodes:
-        node2tree[node] = Tree(node)
-
-    for node, tree in node2tree.items():
-        for knob in node.knobs():
-            for edge in knob.edges:
-                sourceNode = edge.source.node()
-                targetNode = edge.target.node()
-
-                if node == sourceNode:
-                    targetTree = node2tree[targetNode]
-                    if targetTree not in tree.parents:
-                        tree.parents.append(targetTree)
+    def __init__(self, model, nodes=None):
+        """Take all Nodes of the model, or only the given NodeRecords and
+        the Edges between them."""
+        if nodes is None:
+            nodes = model.nodes()
+            edges = model.edges()
+        else:
+            ids = set(node.id for node in nodes)
+            edges = [edge for node in nodes for edge in model.outEdges(node)
+                     if edge.target in ids]
+        index = dict((node.id, i) for i, node in enumerate(nodes))
+        self.uuids = [node.uuid for node in nodes]
+        self.classes = [node.cls for node in nodes]
+        self.sizes = [(node.w, node.h) for node in nodes]
+        self.inputs = [list(node.inputs) for node in nodes]
+        self.outputs = [list(node.outputs) for node in nodes]
+        self.edges = [(index[edge.source], edge.sourceKnob,
+                       index[edge.target], edge.targetKnob)
+                      for edge in edges]
+
+
+def applyPositions(model, positions):
+    """Move the model's Nodes to the given {uuid: (x, y)} positions.
+
+    Nodes that have an item in a scene are moved through it, which in
+    turn updates the model.
+    """
+    for uuid, (x, y) in positions.items():
+        node = model.node(uuid)
+        if node is None:
+            continue
+        if node.item is not None:
+            node.item.setPos(x, y)
+        else:
+            model.moveNode(node, x, y)
 
-                if node == targetNode:
-                    sourceTree = node2tree[sourceNode]
-                    if sourceTree not in tree.children:
-                        tree.children.append(sourceTree)
 
-    trees = node2tree.values()
-    return trees
+def autoLayout(scene, engine=ENGINE_NATIVE, cache=None):
+    """Arrange all Nodes with the given layout engine.
 
+    Works on the scene's GraphModel (a GraphModel may be passed directly,
+    too, e.g. one created with serializer.loadModel()).
 
-def autoLayout(scene):
-    """Tree layout using graphviz.
-
-    Code based on this example: https://gist.github.com/dbr/1255776
+    This blocks until done, see layoutjob.LayoutJob for running it in
+    the background. With a LayoutCache, the result for an unchanged
+    graph is looked up instead of computed again.
     """
     print("auto layout")
 
-    nodes = _getNodesFromScene(scene)
-    if not nodes:
+    model = getattr(scene, "model", scene)
+    if not model.nodeCount():
         return
 
-    trees = _makeTree(nodes)
-
-    class Dotter(object):
-        """Walk the Tree hierarchy and write it to a .dot file."""
-
-        delim = "_"
-
-        def __init__(self):
-            self.graph = pydot.Dot(graph_type="digraph", rankdir="LR")
-            self.checked = []
-            self.counter = 0
-
-        def nodeToName(self, node):
-            # FIXME: Using <classname>_<n-digit-uuid> has a chance
-            #   of name clashes which gets higher the more nodes we
-            #   have. We should use the full uuid as identifier, but
-            #   make sure graphviz does not use it as the node width
-            #   when doing its layouting. Right now that would result
-            #   in graphs that are very far spaced out.
-            return (node.header.text + self.delim + node.uuid[:4])
+    graph = LayoutGraph(model)
+    positions = computeLayout(graph, engine, cache=cache)
+    applyPositions(model, dict((uuid, pos) for uuid, pos
+                               in zip(graph.uuids, positions)
+                               if pos is not None))
 
-        def recursiveGrapher(self, tree, level=0):
-            self.counter += 1
 
-            if tree in self.checked:
-                # Don't redo parts of tree already checked.
-                return
+def computeLayout(graph, engine=ENGINE_NATIVE, progress=None, cache=None):
+    """Return the (x, y) position for each Node of the LayoutGraph.
 
-            self.checked.append(tree)
+    Nodes the engine does not place get None. This only works on the
+    given snapshot, so it may run in another thread.
 
-            for childTree in tree.children:
-                childName = self.nodeToName(childTree.node)
-                parentName = self.nodeToName(tree.node)
-                edge = pydot.Edge(childName, parentName)
-                self.graph.add_edge(edge)
-                print ("{0} Recursing into {1}".format(
-                       level, childName))
-                self.recursiveGrapher(childTree, level=level + 1)
+    The optional progress(fraction) callback is called now and then,
+    it may raise LayoutCancelledError to stop.
 
-        def save(self, filePath):
-            """Writing the graph to file will apply graphviz' layouting."""
-            # TODO: We can use 'dot' or 'neato', however 'neato'
-            #   currently produces pretty bad results (probably related
-            #   to .Dot() settings above, may be worth looking into it.)
-            self.graph.write_dot(filePath, prog="dot")
-
-    def assignDotResultToNodes(dotFile, nodes):
-        """Read positions from file and apply them."""
-
-        # TODO: Use pydot's pydot_parser.py instead.
-        # Extract the node name and its x and y position.
-        pattern = r"(?P<name>[\"]{0,1}[a-zA-Z0-9_-]+[\"]{0,1})\s*\[\w+\=(?:\d+(?:\.\d+){0,1})\,\s*pos\=\"(?P<x>\d+(?:\.\d+){0,1})\,(?P<y>\d+(?:\.\d+){0,1})"  # noqa
+    If a LayoutCache is given, it is asked first and gets the result.
+    """
+    key = None
+    if cache is not None:
+        key = topologyKey(graph, engine, _engineParameters(engine))
+        cached = cache.get(key)
+        if cached is not None:
+            print("using cached layout", key)
+            return [cached.get(uuid) for uuid in graph.uuids]
+
+    if engine == ENGINE_NATIVE:
+        positions = layeredLayout(graph, progress=progress)
+    elif engine == ENGINE_DOT:
+        positions = _dotLayout(graph, progress=progress)
+    elif engine == ENGINE_FORCE:
+        positions = forcelayout.forceLayout(graph, progress=progress)
+    else:
+        raise UnknownLayoutEngineError(
+            "Layout engine not recognized: {0}".format(engine))
+
+    if cache is not None:
+        try:
+            cache.put(key, dict((uuid, pos) for uuid, pos
+                                in zip(graph.uuids, positions)
+                                if pos is not None))
+        except (IOError, OSError) as err:
+            # Not being able to cache is no reason to fail.
+            print("could not cache layout:", err)
+    return positions
+
+
+def _engineParameters(engine):
+    """Return what decides the engine's result, besides the graph."""
+    if engine == ENGINE_NATIVE:
+        return (layered.LAYER_SPACING, layered.NODE_SPACING,
+                layered.COMPONENT_SPACING, layered.DEFAULT_WIDTH,
+                layered.DEFAULT_HEIGHT, layered.CROSSING_SWEEPS,
+                layered.PLACEMENT_SWEEPS)
+    elif engine == ENGINE_FORCE:
+        return (forcelayout.ITERATIONS, forcelayout.COLLISION_ITERATIONS,
+                forcelayout.SPACING, forcelayout.GRAVITY, forcelayout.SEED,
+                forcelayout.DEFAULT_WIDTH, forcelayout.DEFAULT_HEIGHT)
+    return ()
+
+
+def layoutNodes(scene, uuids):
+    """Arrange only the given Nodes, all others stay where they are.
+
+    The Nodes are laid out among themselves, then placed as a block
+    right of the other Nodes feeding them (or left of the ones they
+    feed) and finally moved down until they do not overlap any other
+    Node. The work done depends on the given Nodes and their
+    neighbourhood, not on the size of the scene.
+    """
+    model = getattr(scene, "model", scene)
+    nodes = [model.node(uuid) for uuid in uuids]
+    nodes = [node for node in nodes if node is not None]
+    if not nodes:
+        return
+    print("layout nodes:", len(nodes))
+
+    graph = LayoutGraph(model, nodes)
+    relative = layeredLayout(graph)
+    sizes = [_nodeSize(node) for node in nodes]
+    blockWidth = max(x + w for (x, _), (w, _) in zip(relative, sizes))
+    blockHeight = max(y + h for (_, y), (_, h) in zip(relative, sizes))
+
+    # The pinned Nodes connected to the given ones are the anchors.
+    selected = set(node.uuid for node in nodes)
+    feeding = []
+    fed = []
+    for node in nodes:
+        feeding.extend(n for n in model.children(node)
+                       if n.uuid not in selected)
+        fed.extend(n for n in model.parents(node) if n.uuid not in selected)
+
+    if feeding:
+        left = max(n.x + _nodeSize(n)[0] for n in feeding) + LAYER_SPACING
+    elif fed:
+        left = min(n.x for n in fed) - LAYER_SPACING - blockWidth
+    else:
+        left = min(node.x for node in nodes)
+
+    anchors = feeding + fed
+    if anchors:
+        centers = [n.y + _nodeSize(n)[1] / 2.0 for n in anchors]
+        top = sum(centers) / len(centers) - blockHeight / 2.0
+    else:
+        top = min(node.y for node in nodes)
+
+    top = _avoidObstacles(scene, model, selected, relative, sizes, left, top)
+
+    positions = {}
+    for node, (x, y) in zip(nodes, relative):
+        positions[node.uuid] = (left + x, top + y)
+    applyPositions(model, positions)
+
+
+def _nodeSize(node):
+    return (node.w or DEFAULT_WIDTH, node.h or DEFAULT_HEIGHT)
+
+
+def _intersects(a, b):
+    """Return True if the (x, y, w, h) rectangles overlap."""
+    return (a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and
+            a[1] < b[1] + b[3] and b[1] < a[1] + a[3])
+
+
+def _nodesInRect(scene, model, rect):
+    """Return the NodeRecords intersecting the (x, y, w, h) rectangle."""
+    nodesInRect = getattr(scene, "nodesInRect", None)
+    if nodesInRect is not None:
+        return nodesInRect(*rect)
+    # A plain GraphModel has no spatial index.
+    return [n for n in model.nodes()
+            if _intersects((n.x, n.y) + _nodeSize(n), rect)]
+
+
+def _avoidObstacles(scene, model, selected, relative, sizes, left, top,
+                    maxSteps=100):
+    """Return the top of the block, moved down until none of its Nodes
+    overlaps a Node that is not part of it."""
+    spacing = NODE_SPACING
+    for _ in range(maxSteps):
+        rects = [(left + x - spacing, top + y - spacing,
+                  w + 2 * spacing, h + 2 * spacing)
+                 for (x, y), (w, h) in zip(relative, sizes)]
+        bbox = (min(r[0] for r in rects), min(r[1] for r in rects),
+                max(r[0] + r[2] for r in rects) - min(r[0] for r in rects),
+                max(r[1] + r[3] for r in rects) - min(r[1] for r in rects))
+        shift = 0
+        for obstacle in _nodesInRect(scene, model, bbox):
+            if obstacle.uuid in selected:
+                continue
+            obstacleRect = (obstacle.x, obstacle.y) + _nodeSize(obstacle)
+            for rect in rects:
+                if _intersects(rect, obstacleRect):
+                    bottom = obstacleRect[1] + obstacleRect[3]
+                    shift = max(shift, bottom - rect[1])
+        if not shift:
+            break
+        top += shift
+    return top
+
+
+def _dotLayout(graph, progress=None):
+    """Tree layout using graphviz.
 
+    Code based on this example: https://gist.github.com/dbr/1255776
+    """
+    # Need to have graphviz installed (its bin/ must be on PATH).
+    import pydot
+
+    def nodeToName(index):
+        # FIXME: Using <classname>_<n-digit-uuid> has a chance
+        #   of name clashes which gets higher the more nodes we
+        #   have. We should use the full uuid as identifier, but
+        #   make sure graphviz does not use it as the node width
+        #   when doing its layouting. Right now that would result
+        #   in graphs that are very far spaced out.
+        return graph.classes[index] + "_" + graph.uuids[index][:4]
+
+    dotGraph = pydot.Dot(graph_type="digraph", rankdir="LR")
+    connected = set()
+    for source, _, target, _ in graph.edges:
+        if (source, target) not in connected:
+            connected.add((source, target))
+            dotGraph.add_edge(pydot.Edge(nodeToName(source),
+                                         nodeToName(target)))
+
+    # Writing the graph to file will apply graphviz' layouting.
+    # TODO: We can use 'dot' or 'neato', however 'neato'
+    #   currently produces pretty bad results (probably related
+    #   to .Dot() settings above, may be worth looking into it.)
+    fd, dotFile = tempfile.mkstemp(suffix=".dot")
+    os.close(fd)
+    try:
+        dotGraph.write_dot(dotFile, prog="dot")
         with open(dotFile) as f:
             text = f.read()
-
-        name2node = {}
-        for node in nodes:
-            name = dotter.nodeToName(node)
-            name2node[name] = node
-
-        matches = re.findall(pattern, text)
-        for name, x, y in matches:
-            node = name2node[name]
-            node.setPos(float(x), float(y))
-
-    dataDir = os.path.join(appdirs.user_data_dir(), "qtnodes")
-    try:
-        os.makedirs(dataDir)
-    except OSError:
-        if not os.path.isdir(dataDir):
-            raise
-    dotFile = os.path.join(dataDir, "last_layout.dot")
-    print("writing layout to", dotFile)
-
-    dotter = Dotter()
-    for tree in trees:
-        dotter.recursiveGrapher(tree)
-
-    dotter.save(dotFile)
-    assignDotResultToNodes(dotFile, nodes)
+    finally:
+        os.remove(dotFile)
+    if progress:
+        progress(0.9)
+
+    # TODO: Use pydot's pydot_parser.py instead.
+    # Extract the node name and its x and y position.
+    pattern = r"(?P<name>[\"]{0,1}[a-zA-Z0-9_-]+[\"]{0,1})\s*\[\w+\=(?:\d+(?:\.\d+){0,1})\,\s*pos\=\"(?P<x>\d+(?:\.\d+){0,1})\,(?P<y>\d+(?:\.\d+){0,1})"  # noqa
+
+    name2index = dict((nodeToName(i), i) for i in range(len(graph.uuids)))
+    positions = [None] * len(graph.uuids)
+    for name, x, y in re.findall(pattern, text):
+        positions[name2index[name]] = (float(x), float(y))
+    return positions
@@ -0,0 +1,109 @@
+"""On-disk cache of layout results."""
+
+import os
+import json
+import hashlib
+import tempfile
+
+import appdirs
+
+from .fileio import fromJson, toJson, readFileContent, replaceFile
+
+
+# Bump this whenever the layout engines produce different results.
+CACHE_VERSION = 1
+
+
+def topologyKey(graph, engine, parameters=()):
+    """Return a key that identifies the LayoutGraph's topology.
+
+    Covers the Nodes (uuid, class, size and Knob order) and the Edges,
+    independent of the order they have been added in, plus the engine
+    and its parameters.
+    """
+    nodes = sorted(zip(graph.uuids, graph.classes, graph.sizes,
+                       graph.inputs, graph.outputs))
+    edges = sorted((graph.uuids[source], sourceKnob,
+                    graph.uuids[target], targetKnob)
+                   for source, sourceKnob, target, targetKnob in graph.edges)
+    data = json.dumps([CACHE_VERSION, engine, list(parameters), nodes, edges],
+                      separators=(",", ":"))
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class LayoutCache(object):
+    """Layout results as {uuid: (x, y)}, stored in files by their key.
+
+    Once the files take more than maxSize bytes, the least recently
+    used ones are removed.
+    """
+
+    def __init__(self, directory=None, maxSize=20 * 1024 * 1024):
+        if directory is None:
+            directory = os.path.join(appdirs.user_cache_dir("qtnodes"),
+                                     "layouts")
+        self.directory = directory
+        self.maxSize = maxSize
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        """Return the cached positions, None if there are none."""
+        path = self._path(key)
+        try:
+            positions = fromJson(readFileContent(path))
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            # Mark as recently used.
+            os.utime(path, None)
+        except OSError:
+            pass
+        return dict((uuid, tuple(pos)) for uuid, pos in positions.items())
+
+    def put(self, key, positions):
+        """Store the positions and evict old entries if needed."""
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            if not os.path.isdir(self.directory):
+                raise
+
+        # Write to a temporary file first, so readers never see half of it.
+        fd, tempPath = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            f.write(toJson(positions))
+        replaceFile(tempPath, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries beyond maxSize."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.maxSize:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        """Remove all cached layouts."""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,163 @@
+"""Auto layout in the background, keeping the UI responsive."""
+
+import time
+import threading
+
+from PySide import QtCore
+
+from .layout import LayoutGraph, computeLayout, applyPositions, ENGINE_NATIVE
+from .exceptions import LayoutCancelledError
+
+
+class LayoutJob(QtCore.QObject):
+    """Lay out all Nodes of a NodeGraphWidget's scene in the background.
+
+    The layout is computed in a worker thread on a LayoutGraph snapshot,
+    so the scene can be used meanwhile (Nodes removed until the layout
+    is done are skipped). The result is applied on the UI thread, either
+    as a short animation or, for many Nodes, at once in a batch.
+
+    The widget's layoutCache is used, if it has one.
+
+        job = LayoutJob(graph)
+        job.progress.connect(progressBar.setValue)
+        job.failed.connect(reportError)
+        job.start()
+    """
+
+    progress = QtCore.Signal(int)  # Percent of the layout computed.
+    finished = QtCore.Signal()
+    cancelled = QtCore.Signal()
+    failed = QtCore.Signal(object)  # The error computing the layout.
+
+    def __init__(self, graphWidget, engine=ENGINE_NATIVE, parent=None):
+        super(LayoutJob, self).__init__(parent=parent)
+        self.graphWidget = graphWidget
+        self.engine = engine
+
+        # Seconds to move the Nodes to their new positions. More Nodes
+        # than animationLimit are moved at once instead.
+        self.animationDuration = 0.3
+        self.animationLimit = 500
+
+        self._scene = None
+        self._cache = None
+        self._thread = None
+
+        # Shared with the worker thread.
+        self._cancel = False
+        self._percent = 0
+        self._positions = None
+        self._error = None
+
+        self._lastPercent = -1
+        self._moves = None  # [(Node, (x, y), (x, y))] while animating.
+        self._animationStart = None
+
+        # Polls the worker, then drives the animation.
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(15)
+        self._timer.timeout.connect(self._step)
+
+    def isRunning(self):
+        return self._timer.isActive()
+
+    def start(self):
+        """Take a snapshot of the widget's current scene and begin."""
+        self._scene = self.graphWidget.scene
+        self._cache = getattr(self.graphWidget, "layoutCache", None)
+        graph = LayoutGraph(self._scene.model)
+        self._thread = threading.Thread(target=self._compute, args=(graph,))
+        self._thread.daemon = True
+        self._thread.start()
+        self._timer.start()
+
+    def cancel(self):
+        """Stop computing the layout, the Nodes stay where they are.
+
+        Once the Nodes are being moved, this has no effect.
+        """
+        if self._moves is not None or not self.isRunning():
+            return
+        self._cancel = True
+        self._timer.stop()
+        self.cancelled.emit()
+
+    def _compute(self, graph):
+        """Run in the worker thread, must not touch any items."""
+
+        def report(fraction):
+            if self._cancel:
+                raise LayoutCancelledError("Layout cancelled.")
+            self._percent = int(100 * fraction)
+
+        try:
+            positions = computeLayout(graph, self.engine, progress=report,
+                                      cache=self._cache)
+        except LayoutCancelledError:
+            return
+        except Exception as err:
+            self._error = err
+            return
+        self._positions = dict((uuid, pos) for uuid, pos
+                               in zip(graph.uuids, positions)
+                               if pos is not None)
+
+    def _step(self):
+        if self._moves is not None:
+            self._animate()
+            return
+
+        if self._percent != self._lastPercent:
+            self._lastPercent = self._percent
+            self.progress.emit(self._percent)
+        if self._thread.is_alive():
+            return
+
+        if self._error is not None:
+            # Raising here would only end up in the event loop.
+            self._timer.stop()
+            self.failed.emit(self._error)
+            return
+        if self.graphWidget.scene is not self._scene:
+            # The scene has been replaced meanwhile.
+            self._timer.stop()
+            self.cancelled.emit()
+            return
+        self._apply()
+
+    def _apply(self):
+        """Move the Nodes to the computed positions."""
+        model = self._scene.model
+        moves = []
+        for uuid, (x, y) in self._positions.items():
+            node = model.node(uuid)
+            if node is not None and node.item is not None:
+                pos = node.item.pos()
+                moves.append((node.item, (pos.x(), pos.y()), (x, y)))
+
+        if len(moves) > self.animationLimit or self.animationDuration <= 0:
+            with self.graphWidget.batchUpdates():
+                applyPositions(model, self._positions)
+            self._finish()
+            return
+
+        self._moves = moves
+        self._animationStart = time.time()
+
+    def _animate(self):
+        elapsed = time.time() - self._animationStart
+        t = min(1.0, elapsed / self.animationDuration)
+        # Ease in and out.
+        t = t * t * (3 - 2 * t)
+        for node, (x0, y0), (x1, y1) in self._moves:
+            if node.scene() is self._scene:
+                node.setPos(x0 + (x1 - x0) * t, y0 + (y1 - y0) * t)
+        if elapsed >= self.animationDuration:
+            self._finish()
+
+    def _finish(self):
+        self._timer.stop()
+        self._moves = None
+        self.graphWidget.view.redrawEdges()
+        self.finished.emit()
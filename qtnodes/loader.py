@@ -0,0 +1,122 @@
+"""Incremental scene loading that keeps the UI responsive."""
+
+import os
+import time
+
+from PySide import QtCore
+
+from . import serializer
+
+
+class SceneLoader(QtCore.QObject):
+    """Stream a scene file into a NodeGraphWidget in small steps.
+
+    Nodes and Edges are read from the file as they come and added in
+    time-boxed chunks, returning control to the Qt event loop in between.
+    Everything loaded so far is immediately visible and usable.
+
+    Edges that reference a Node which has not been read yet are kept
+    until that Node arrives. The file's journal is applied at the end.
+
+        loader = SceneLoader(graph, "huge.json")
+        loader.progress.connect(progressBar.setValue)
+        loader.failed.connect(reportError)
+        loader.start()
+    """
+
+    progress = QtCore.Signal(int)  # Percent of the file read.
+    finished = QtCore.Signal()
+    cancelled = QtCore.Signal()
+    failed = QtCore.Signal(object)  # The error loading the file.
+
+    def __init__(self, graphWidget, filePath, parent=None):
+        super(SceneLoader, self).__init__(parent=parent)
+        self.graphWidget = graphWidget
+        self.filePath = filePath
+
+        # Time to spend building the scene before yielding to the UI.
+        self.stepDuration = 0.02
+
+        self._scene = None
+        self._entries = None
+        self._classMap = None
+        self._pendingEdges = {}  # Missing Node uuid -> [edgeData].
+        self._fileSize = max(os.path.getsize(filePath), 1)
+        self._lastPercent = -1
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self._step)
+
+    def isRunning(self):
+        return self._timer.isActive()
+
+    def start(self):
+        """Begin loading into the widget's current scene."""
+        self._scene = self.graphWidget.scene
+        self._entries = serializer.iterSceneFile(self.filePath)
+        self._classMap = serializer.getClassMap(self.graphWidget)
+
+        # Keep the scene index suspended until loading is done, but do
+        # not block viewport updates, so the scene can be used already.
+        self._scene.beginBatch()
+        self._timer.start()
+
+    def cancel(self):
+        """Stop loading, keeping whatever has been loaded so far."""
+        if self.isRunning():
+            self._stop()
+            self.cancelled.emit()
+
+    def _stop(self):
+        self._timer.stop()
+        self._entries.close()
+        self._scene.endBatch()
+
+    def _step(self):
+        """Build the scene for a limited amount of time."""
+        deadline = time.time() + self.stepDuration
+        position = None
+        try:
+            for key, data, position in self._entries:
+                if key == "nodes":
+                    self._addNode(data)
+                else:
+                    self._addEdge(data)
+                if time.time() > deadline:
+                    break
+            else:
+                self._stop()
+                # Changes saved incrementally since the file was written.
+                for delta in serializer.readJournal(self.filePath):
+                    serializer.reconstructDelta(self.graphWidget, delta)
+                self._reportProgress(self._fileSize)
+                self.finished.emit()
+                return
+        except Exception as err:
+            # Raising here would only end up in the event loop.
+            self._stop()
+            self.failed.emit(err)
+            return
+
+        self._scene.commitDeferredEdges()
+        self._reportProgress(position)
+
+    def _addNode(self, nodeData):
+        serializer.reconstructNode(self.graphWidget, self._classMap, nodeData)
+        for edgeData in self._pendingEdges.pop(nodeData["uuid"], []):
+            self._addEdge(edgeData)
+
+    def _addEdge(self, edgeData):
+        for key in ("source_nodeId", "target_nodeId"):
+            nodeId = edgeData[key]
+            if self.graphWidget.getNodeById(nodeId) is None:
+                self._pendingEdges.setdefault(nodeId, []).append(edgeData)
+                return
+        serializer.reconstructEdge(self.graphWidget, edgeData)
+
+    def _reportProgress(self, position):
+        percent = min(100, int(100.0 * position / self._fileSize))
+        if percent != self._lastPercent:
+            self._lastPercent = percent
+            self.progress.emit(percent)
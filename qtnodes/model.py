@@ -0,0 +1,323 @@
+"""Headless graph model.
+
+The GraphModel holds the topology of a node graph (what Nodes there are,
+where they are and how their Knobs are connected) as plain Python data.
+It does not depend on Qt, so serialization, layouting and traversal can
+work on it without any QGraphicsItems or a QApplication.
+
+In the editor, the GraphScene owns a GraphModel and the Node and Edge
+items keep it up to date (see Node.itemChange() and Edge.register()).
+Each record keeps a reference to its item, if it has one.
+
+Nodes and Edges are identified by integer ids, which are never reused
+within a model. Nodes can also be looked up by their uuid.
+"""
+
+from .exceptions import GraphModelError
+
+
+# Change notifications, passed to subscribers as callback(event, record).
+# NODE_RENAMED additionally passes the previous uuid.
+NODE_ADDED = "node_added"
+NODE_REMOVED = "node_removed"
+NODE_MOVED = "node_moved"
+NODE_RESIZED = "node_resized"
+NODE_RENAMED = "node_renamed"
+KNOBS_CHANGED = "knobs_changed"
+EDGE_ADDED = "edge_added"
+EDGE_REMOVED = "edge_removed"
+
+
+class NodeRecord(object):
+    """Compact representation of a Node.
+
+    The knob tables `inputs` and `outputs` list the Knob names in the
+    order they have been added to the Node.
+    """
+
+    __slots__ = ("id", "uuid", "cls", "x", "y", "w", "h",
+                 "inputs", "outputs", "item")
+
+    def __init__(self, id, uuid, cls, x=0.0, y=0.0, w=0, h=0,
+                 inputs=(), outputs=(), item=None):
+        self.id = id
+        self.uuid = uuid
+        self.cls = cls
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.item = item
+
+    def __repr__(self):
+        return "<NodeRecord {0} {1} {2}>".format(self.id, self.cls, self.uuid)
+
+
+class EdgeRecord(object):
+    """Compact representation of an Edge.
+
+    Direction is the same as enforced by ensureEdgeDirection(): The
+    source is the id of the Node with the OutputKnob, the target the id
+    of the Node with the InputKnob.
+    """
+
+    __slots__ = ("id", "source", "sourceKnob", "target", "targetKnob", "item")
+
+    def __init__(self, id, source, sourceKnob, target, targetKnob, item=None):
+        self.id = id
+        self.source = source
+        self.sourceKnob = sourceKnob
+        self.target = target
+        self.targetKnob = targetKnob
+        self.item = item
+
+    def __repr__(self):
+        return "<EdgeRecord {0} {1}.{2} -> {3}.{4}>".format(
+            self.id, self.source, self.sourceKnob,
+            self.target, self.targetKnob)
+
+
+class GraphModel(object):
+    """The Nodes and Edges of a graph, with adjacency by integer id."""
+
+    def __init__(self):
+        self._nodes = []  # Node id -> NodeRecord, None once removed.
+        self._edges = []  # Edge id -> EdgeRecord, None once removed.
+        self._ids = {}  # uuid -> Node id.
+
+        # Node id -> list of Edge ids, leaving / entering the Node.
+        self._outEdges = []
+        self._inEdges = []
+
+        # (source id, source Knob, target id, target Knob) -> Edge id.
+        self._connections = {}
+        # (Node id, Knob name) -> number of Edges attached to that Knob.
+        self._degrees = {}
+
+        self._numNodes = 0
+        self._numEdges = 0
+
+        self._listeners = []
+
+    # Notifications.
+
+    def subscribe(self, callback):
+        """Call callback(event, record, *args) on every change."""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, event, record, *args):
+        for callback in self._listeners:
+            callback(event, record, *args)
+
+    # Queries.
+
+    def nodeCount(self):
+        return self._numNodes
+
+    def edgeCount(self):
+        return self._numEdges
+
+    def node(self, uuid):
+        """Return the NodeRecord with the given uuid, None otherwise."""
+        nodeId = self._ids.get(uuid)
+        if nodeId is None:
+            return None
+        return self._nodes[nodeId]
+
+    def nodeById(self, nodeId):
+        """Return the NodeRecord with the given integer id."""
+        return self._nodes[nodeId]
+
+    def edgeById(self, edgeId):
+        """Return the EdgeRecord with the given integer id."""
+        return self._edges[edgeId]
+
+    def nodes(self):
+        """Return all NodeRecords, in the order they have been added."""
+        return [n for n in self._nodes if n is not None]
+
+    def edges(self):
+        """Return all EdgeRecords, in the order they have been added."""
+        return [e for e in self._edges if e is not None]
+
+    def _edgeIds(self, table, node):
+        """Return the Node's Edge ids from _outEdges or _inEdges."""
+        if not self.contains(node):
+            raise GraphModelError(
+                "{0} is not part of the model.".format(node))
+        return table[node.id]
+
+    def outEdges(self, node):
+        """Return the EdgeRecords that have the given Node as source."""
+        return [self._edges[i] for i in self._edgeIds(self._outEdges, node)]
+
+    def inEdges(self, node):
+        """Return the EdgeRecords that have the given Node as target."""
+        return [self._edges[i] for i in self._edgeIds(self._inEdges, node)]
+
+    def parents(self, node):
+        """Return the Nodes fed by the given Node's outputs (unique)."""
+        ids = []
+        for i in self._edgeIds(self._outEdges, node):
+            target = self._edges[i].target
+            if target not in ids:
+                ids.append(target)
+        return [self._nodes[i] for i in ids]
+
+    def children(self, node):
+        """Return the Nodes feeding the given Node's inputs (unique)."""
+        ids = []
+        for i in self._edgeIds(self._inEdges, node):
+            source = self._edges[i].source
+            if source not in ids:
+                ids.append(source)
+        return [self._nodes[i] for i in ids]
+
+    def findEdge(self, source, sourceKnob, target, targetKnob):
+        """Return the EdgeRecord connecting the given Knobs, None otherwise."""
+        edgeId = self._connections.get(
+            (source.id, sourceKnob, target.id, targetKnob))
+        if edgeId is None:
+            return None
+        return self._edges[edgeId]
+
+    def isConnected(self, source, sourceKnob, target, targetKnob):
+        """Return True if there is an Edge between the given Knobs."""
+        key = (source.id, sourceKnob, target.id, targetKnob)
+        return key in self._connections
+
+    def knobDegree(self, node, knob):
+        """Return the number of Edges attached to the Node's named Knob."""
+        return self._degrees.get((node.id, knob), 0)
+
+    def contains(self, record):
+        """Return True if the Node- or EdgeRecord is part of this model."""
+        if isinstance(record, NodeRecord):
+            records = self._nodes
+        else:
+            records = self._edges
+        return 0 <= record.id < len(records) and records[record.id] is record
+
+    # Modifications.
+
+    def addNode(self, uuid, cls, x=0.0, y=0.0, w=0, h=0,
+                inputs=(), outputs=(), item=None):
+        """Create and return a new NodeRecord."""
+        if uuid in self._ids:
+            raise GraphModelError(
+                "A Node with uuid {0} already exists.".format(uuid))
+        node = NodeRecord(len(self._nodes), uuid, cls, x, y, w, h,
+                          inputs, outputs, item)
+        self._nodes.append(node)
+        self._outEdges.append([])
+        self._inEdges.append([])
+        self._ids[uuid] = node.id
+        self._numNodes += 1
+        self._notify(NODE_ADDED, node)
+        return node
+
+    def removeNode(self, node):
+        """Remove the NodeRecord and all its EdgeRecords."""
+        if not self.contains(node):
+            return
+        for edgeId in self._outEdges[node.id] + self._inEdges[node.id]:
+            edge = self._edges[edgeId]
+            if edge is not None:
+                self.removeEdge(edge)
+        self._nodes[node.id] = None
+        self._outEdges[node.id] = None
+        self._inEdges[node.id] = None
+        del self._ids[node.uuid]
+        self._numNodes -= 1
+        self._notify(NODE_REMOVED, node)
+
+    def moveNode(self, node, x, y):
+        node.x = x
+        node.y = y
+        self._notify(NODE_MOVED, node)
+
+    def resizeNode(self, node, w, h):
+        node.w = w
+        node.h = h
+        self._notify(NODE_RESIZED, node)
+
+    def setNodeUuid(self, node, uuid):
+        """Give the NodeRecord a new uuid, keeping the index up to date."""
+        if uuid == node.uuid:
+            return
+        if uuid in self._ids:
+            raise GraphModelError(
+                "A Node with uuid {0} already exists.".format(uuid))
+        oldUuid = node.uuid
+        del self._ids[oldUuid]
+        node.uuid = uuid
+        self._ids[uuid] = node.id
+        self._notify(NODE_RENAMED, node, oldUuid)
+
+    def addKnob(self, node, name, output=False):
+        """Append a Knob name to the Node's input or output table."""
+        (node.outputs if output else node.inputs).append(name)
+        self._notify(KNOBS_CHANGED, node)
+
+    def removeKnob(self, node, name):
+        """Remove a Knob name from the Node's knob tables."""
+        for table in (node.inputs, node.outputs):
+            if name in table:
+                table.remove(name)
+        self._notify(KNOBS_CHANGED, node)
+
+    def addEdge(self, source, sourceKnob, target, targetKnob, item=None):
+        """Create and return a new EdgeRecord between two NodeRecords.
+
+        There can only be one Edge between the same two Knobs.
+        """
+        if not (self.contains(source) and self.contains(target)):
+            raise GraphModelError("Both Nodes must be part of the model.")
+        key = (source.id, sourceKnob, target.id, targetKnob)
+        if key in self._connections:
+            raise GraphModelError("The Knobs are already connected.")
+        edge = EdgeRecord(len(self._edges), source.id, sourceKnob,
+                          target.id, targetKnob, item)
+        self._edges.append(edge)
+        self._outEdges[source.id].append(edge.id)
+        self._inEdges[target.id].append(edge.id)
+        self._connections[key] = edge.id
+        self._changeDegree(source.id, sourceKnob, 1)
+        self._changeDegree(target.id, targetKnob, 1)
+        self._numEdges += 1
+        self._notify(EDGE_ADDED, edge)
+        return edge
+
+    def removeEdge(self, edge):
+        """Remove the EdgeRecord. Unknown records are ignored."""
+        if not self.contains(edge):
+            return
+        self._edges[edge.id] = None
+        self._outEdges[edge.source].remove(edge.id)
+        self._inEdges[edge.target].remove(edge.id)
+        del self._connections[(edge.source, edge.sourceKnob,
+                               edge.target, edge.targetKnob)]
+        self._changeDegree(edge.source, edge.sourceKnob, -1)
+        self._changeDegree(edge.target, edge.targetKnob, -1)
+        self._numEdges -= 1
+        self._notify(EDGE_REMOVED, edge)
+
+    def _changeDegree(self, nodeId, knob, step):
+        key = (nodeId, knob)
+        degree = self._degrees.get(key, 0) + step
+        if degree:
+            self._degrees[key] = degree
+        else:
+            del self._degrees[key]
+
+    def clear(self):
+        """Remove all Nodes and Edges."""
+        for node in self.nodes():
+            self.removeNode(node)
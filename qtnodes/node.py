@@ -1,12 +1,15 @@
 """Node classes."""
 
 import uuid
+from collections import OrderedDict
 
 from PySide import QtGui
 from PySide import QtCore
 
-from .helpers import getTextSize
-from .knob import Knob, InputKnob, OutputKnob
+from .helpers import (getTextSize, getLevelOfDetail,
+                      LOD_MINIMAL, LOD_REDUCED)
+from .knob import InputKnob, OutputKnob
+from .scene import GraphScene
 from .exceptions import DuplicateKnobNameError
 
 
@@ -19,10 +22,23 @@ class Node(QtGui.QGraphicsItem):
         super(Node, self).__init__(**kwargs)
 
         # This unique id is useful for serialization/reconstruction.
-        self.uuid = str(uuid.uuid4())
+        self._uuid = str(uuid.uuid4())
+
+        # Our representation in the scene's GraphModel, if any.
+        self.record = None
 
         self.header = None
 
+        # Knobs by name, in the order they have been added. The inputs and
+        # outputs are kept separately as well.
+        self._knobs = OrderedDict()
+        self._inputs = OrderedDict()
+        self._outputs = OrderedDict()
+
+        # Space needed by all Knobs, see addKnob() and removeKnob().
+        self._knobsWidth = 0
+        self._knobsHeight = 0
+
         self.x = 0
         self.y = 0
         self.w = 10
@@ -36,6 +52,7 @@ class Node(QtGui.QGraphicsItem):
         # General configuration.
         self.setFlag(QtGui.QGraphicsItem.ItemIsSelectable)
         self.setFlag(QtGui.QGraphicsItem.ItemIsMovable)
+        self.setFlag(QtGui.QGraphicsItem.ItemSendsGeometryChanges)
 
         self.setCursor(QtCore.Qt.SizeAllCursor)
 
@@ -43,64 +60,132 @@ class Node(QtGui.QGraphicsItem):
         self.setAcceptTouchEvents(True)
         self.setAcceptDrops(True)
 
+    @property
+    def uuid(self):
+        return self._uuid
+
+    @uuid.setter
+    def uuid(self, value):
+        if self.record is not None:
+            self.scene().model.setNodeUuid(self.record, value)
+        self._uuid = value
+
+    def register(self):
+        """Add a record for this Node to its scene's GraphModel.
+
+        This happens automatically when the Node is added to a GraphScene.
+        """
+        model = getattr(self.scene(), "model", None)
+        if model is None or self.record is not None:
+            return
+        pos = self.pos()
+        self.record = model.addNode(
+            self._uuid, self.__class__.__name__, pos.x(), pos.y(),
+            self.w, self.h,
+            inputs=list(self._inputs), outputs=list(self._outputs),
+            item=self)
+
+    def unregister(self):
+        """Remove our record from the scene's GraphModel."""
+        if self.record is None:
+            return
+        self.scene().model.removeNode(self.record)
+        self.record = None
+
+    def itemChange(self, change, value):
+        """Keep our record in the scene's GraphModel in sync."""
+        if change == QtGui.QGraphicsItem.ItemPositionHasChanged:
+            if self.record is not None:
+                self.scene().model.moveNode(
+                    self.record, value.x(), value.y())
+            self.updateEdges()
+        elif change == QtGui.QGraphicsItem.ItemSceneChange:
+            self.unregister()
+        elif change == QtGui.QGraphicsItem.ItemSceneHasChanged:
+            self.register()
+        return super(Node, self).itemChange(change, value)
+
     def knobs(self, cls=None):
-        """Return a list of childItems that are Knob objects.
+        """Return a list of our Knobs, in the order they have been added.
 
         If the optional `cls` is specified, return only Knobs of that class.
         This is useful e.g. to get all InputKnobs or OutputKnobs.
         """
-        knobs = []
-        for child in self.childItems():
-            if isinstance(child, Knob):
-                knobs.append(child)
-
-        if cls:
-            knobs = filter(knobs, lambda k: k.__class__ is cls)
-
-        return knobs
+        if cls is None:
+            return list(self._knobs.values())
+        if issubclass(cls, InputKnob):
+            knobs = self._inputs.values()
+        elif issubclass(cls, OutputKnob):
+            knobs = self._outputs.values()
+        else:
+            knobs = self._knobs.values()
+        return [k for k in knobs if k.__class__ is cls]
 
     def knob(self, name):
         """Return matching Knob by its name, None otherwise."""
-        for knob in self.knobs():
-            if knob.name == name:
-                return knob
-        return None
+        return self._knobs.get(name)
 
     def boundingRect(self):
-        """Return the bounding box of the Node, limited in height to its Header.
+        """Return the bounding box of the Node, which is everything it
+        paints."""
+        rect = QtCore.QRect(self.x,
+                            self.y,
+                            self.w,
+                            self.h)
+        return rect
+
+    def shape(self):
+        """Return the Node's shape, limited in height to its Header.
 
         This is so that the drag & drop sensitive area for the Node is only
         active when hovering its Header, as otherwise there would be conflicts
         with the hover events for the Node's Knobs.
         """
-        rect = QtCore.QRect(self.x,
-                            self.y,
-                            self.w,
-                            self.header.h)
-        return rect
+        path = QtGui.QPainterPath()
+        path.addRect(QtCore.QRect(self.x,
+                                  self.y,
+                                  self.w,
+                                  self.header.h if self.header else self.h))
+        return path
+
+    def _knobWidth(self, knob):
+        """Return the width needed to fit the Knob and its label."""
+        return knob.w + self.margin + getTextSize(knob.displayName).width()
 
     def updateSizeForChildren(self):
         """Adjust width and height as needed for header and knobs."""
+        self._knobsWidth = max([0] + [self._knobWidth(k)
+                                      for k in self._knobs.values()])
+        self._knobsHeight = sum([k.h + self.margin
+                                 for k in self._knobs.values()])
+        self._resize()
 
-        def adjustHeight():
-            """Adjust height to fit header and all knobs."""
-            knobs = [c for c in self.childItems() if isinstance(c, Knob)]
-            knobsHeight = sum([k.h + self.margin for k in knobs])
-            heightNeeded = self.header.h + knobsHeight + self.margin
-            self.h = heightNeeded
-
-        def adjustWidth():
-            """Adjust width as needed for the widest child item."""
-            headerWidth = (self.margin + getTextSize(self.header.text).width())
+    def _resize(self):
+        """Apply the space needed by the header and the Knobs.
 
-            knobs = [c for c in self.childItems() if isinstance(c, Knob)]
-            knobWidths = [k.w + self.margin + getTextSize(k.displayName).width()
-                          for k in knobs]
-            maxWidth = max([headerWidth] + knobWidths)
-            self.w = maxWidth + self.margin
-
-        adjustWidth()
-        adjustHeight()
+        Only the header is measured here, the Knobs have been accounted
+        for by whoever changed them.
+        """
+        headerWidth = 0
+        headerHeight = 0
+        if self.header:
+            headerWidth = self.margin + getTextSize(self.header.text).width()
+            headerHeight = self.header.h
+
+        w = max(headerWidth, self._knobsWidth) + self.margin
+        h = headerHeight + self._knobsHeight + self.margin
+        if (w, h) == (self.w, self.h):
+            return
+
+        # Our (and the Header's) bounding rect is about to change.
+        self.prepareGeometryChange()
+        if self.header:
+            self.header.prepareGeometryChange()
+        self.w = w
+        self.h = h
+
+        if self.record is not None:
+            self.scene().model.resizeNode(self.record, self.w, self.h)
 
     def addHeader(self, header):
         """Assign the given header and adjust the Node's size for it."""
@@ -121,19 +206,31 @@ class Node(QtGui.QGraphicsItem):
         The position of the Knob is set relative to this Node and depends on it
         either being an Input- or OutputKnob.
         """
-        knobNames = [k.name for k in self.knobs()]
-        if knob.name in knobNames:
+        if knob.name in self._knobs:
             raise DuplicateKnobNameError(
                 "Knob names must be unique, but {0} already exists."
                 .format(knob.name))
 
-        children = [c for c in self.childItems()]
-        yOffset = sum([c.h + self.margin for c in children])
+        yOffset = self._knobsHeight
+        if self.header:
+            yOffset += self.header.h + self.margin
         xOffset = self.margin / 2
 
         knob.setParentItem(self)
         knob.margin = self.margin
-        self.updateSizeForChildren()
+        self._knobs[knob.name] = knob
+        if isinstance(knob, OutputKnob):
+            self._outputs[knob.name] = knob
+        elif isinstance(knob, InputKnob):
+            self._inputs[knob.name] = knob
+        if self.record is not None:
+            self.scene().model.addKnob(self.record, knob.name,
+                                       output=isinstance(knob, OutputKnob))
+
+        # Only the new Knob needs to be measured.
+        self._knobsWidth = max(self._knobsWidth, self._knobWidth(knob))
+        self._knobsHeight += knob.h + self.margin
+        self._resize()
 
         bbox = self.boundingRect()
         if isinstance(knob, OutputKnob):
@@ -143,17 +240,47 @@ class Node(QtGui.QGraphicsItem):
 
     def removeKnob(self, knob):
         """Remove the Knob reference to this node and resize."""
+        if self._knobs.get(knob.name) is not knob:
+            return
         knob.setParentItem(None)
-        self.updateSizeForChildren()
+        del self._knobs[knob.name]
+        self._inputs.pop(knob.name, None)
+        self._outputs.pop(knob.name, None)
+        if self.record is not None:
+            self.scene().model.removeKnob(self.record, knob.name)
+
+        self._knobsHeight -= knob.h + self.margin
+        # Only measure the remaining Knobs if we lost the widest one.
+        if self._knobWidth(knob) >= self._knobsWidth:
+            self._knobsWidth = max([0] + [self._knobWidth(k)
+                                          for k in self._knobs.values()])
+        self._resize()
 
     def paint(self, painter, option, widget):
-        """Draw the Node's container rectangle."""
+        """Draw the Node's container rectangle.
+
+        When zoomed out far, only a plain rectangle or even just a point
+        is drawn (see helpers.getLevelOfDetail()).
+        """
+        lod = getLevelOfDetail(painter, option)
+        if lod == LOD_MINIMAL:
+            if self.header is not None:
+                color = self.header.fillColor
+            else:
+                color = self.fillColor
+            pen = QtGui.QPen(color, 3)
+            pen.setCosmetic(True)
+            painter.setPen(pen)
+            painter.drawPoint(self.x + self.w / 2.0, self.y + self.h / 2.0)
+            return
+
         painter.setBrush(QtGui.QBrush(self.fillColor))
         painter.setPen(QtGui.QPen(QtCore.Qt.NoPen))
 
-        # The bounding box is only as high as the header (we do this
-        # to limit the area that is drag-enabled). Accommodate for that.
         bbox = self.boundingRect()
+        if lod == LOD_REDUCED:
+            painter.drawRect(self.x, self.y, bbox.width(), self.h)
+            return
         painter.drawRoundedRect(self.x,
                                 self.y,
                                 bbox.width(),
@@ -161,22 +288,31 @@ class Node(QtGui.QGraphicsItem):
                                 self.roundness,
                                 self.roundness)
 
-    def mouseMoveEvent(self, event):
-        """Update selected item's (and children's) positions as needed.
+    def updateEdges(self):
+        """Update the paths of all Edges connected to this Node.
 
-        We assume here that only Nodes can be selected.
+        In a GraphScene, they are only marked dirty, so that Edges shared
+        by several moved Nodes are updated just once.
+        """
+        edges = [edge for knob in self.knobs() for edge in knob.edges]
+        scene = self.scene()
+        if isinstance(scene, GraphScene):
+            scene.markEdgesDirty(edges)
+        else:
+            for edge in edges:
+                edge.updatePath()
+
+    def mouseMoveEvent(self, event):
+        """Move all selected Nodes, then update their Edges at once.
 
-        We cannot just update our own childItems, since we are using
-        RubberBandDrag, and that would lead to otherwise e.g. Edges
-        visually lose their connection until an attached Node is moved
-        individually.
+        Moving a Node marks its Edges dirty (see itemChange()), committing
+        them here updates each Edge once per mouse move, even when both
+        its Nodes are selected.
         """
-        nodes = self.scene().selectedItems()
-        for node in nodes:
-            for knob in node.knobs():
-                for edge in knob.edges:
-                    edge.updatePath()
         super(Node, self).mouseMoveEvent(event)
+        scene = self.scene()
+        if isinstance(scene, GraphScene):
+            scene.commitDeferredEdges()
 
     def destroy(self):
         """Remove this Node, its Header, Knobs and connected Edges."""
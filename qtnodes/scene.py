@@ -0,0 +1,98 @@
+"""Custom QGraphicsScene."""
+
+from PySide import QtGui
+from PySide import QtCore
+
+from .model import GraphModel, NodeRecord
+
+
+class GraphScene(QtGui.QGraphicsScene):
+    """A scene that keeps a GraphModel of its Nodes and Edges and can
+    defer expensive bookkeeping during bulk edits.
+
+    The model is kept in sync by the items themselves, see Node.itemChange()
+    and Edge.register().
+
+    While a batch is open (see beginBatch() and endBatch()), the scene
+    does not maintain its BSP item index and Edge paths are only
+    collected instead of being recomputed. Both is done once, when the
+    outermost batch is closed.
+
+    Outside of batches, Edges of moving Nodes are collected the same way
+    and updated once control returns to the event loop (markEdgesDirty()).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(GraphScene, self).__init__(*args, **kwargs)
+        self.model = GraphModel()
+        self._batchDepth = 0
+        self._deferredEdges = set()
+        self._commitScheduled = False
+
+    def isBatching(self):
+        """Return True if a batch is currently open."""
+        return self._batchDepth > 0
+
+    def beginBatch(self):
+        """Open a (possibly nested) batch."""
+        if not self._batchDepth:
+            self.setItemIndexMethod(QtGui.QGraphicsScene.NoIndex)
+        self._batchDepth += 1
+
+    def endBatch(self):
+        """Close a batch, committing all deferred work if it was the
+        outermost one."""
+        self._batchDepth -= 1
+        if self._batchDepth:
+            return
+
+        self.commitDeferredEdges()
+
+        # Switching back rebuilds the index for all items in one go.
+        self.setItemIndexMethod(QtGui.QGraphicsScene.BspTreeIndex)
+
+    def commitDeferredEdges(self):
+        """Update the paths of all Edges collected so far."""
+        edges = self._deferredEdges
+        self._deferredEdges = set()
+        for edge in edges:
+            if edge.scene() is self:
+                edge.updatePath()
+
+    def updateEdgePath(self, edge):
+        """Update the Edge's path now, or when the current batch ends."""
+        if self._batchDepth:
+            self._deferredEdges.add(edge)
+        else:
+            edge.updatePath()
+
+    def markEdgesDirty(self, edges):
+        """Update the Edges' paths once control returns to the event loop.
+
+        This is meant for frequent changes, e.g. while dragging Nodes:
+        Each Edge is only updated once, no matter how often it has been
+        marked until then. Within a batch, this waits for its end.
+        """
+        self._deferredEdges.update(edges)
+        if not self._batchDepth and not self._commitScheduled:
+            self._commitScheduled = True
+            QtCore.QTimer.singleShot(0, self._commitScheduledEdges)
+
+    def _commitScheduledEdges(self):
+        self._commitScheduled = False
+        if not self._batchDepth:
+            self.commitDeferredEdges()
+
+    def nodesInRect(self, x, y, w, h):
+        """Return the NodeRecords of all Nodes intersecting the rectangle.
+
+        This uses the scene's item index, so only the neighbourhood of
+        the rectangle is looked at.
+        """
+        rect = QtCore.QRectF(x, y, w, h)
+        records = []
+        for item in self.items(rect, QtCore.Qt.IntersectsItemBoundingRect):
+            record = getattr(item, "record", None)
+            if isinstance(record, NodeRecord):
+                records.append(record)
+        return records
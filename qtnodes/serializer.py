@@ -1,12 +1,15 @@
 """Serialization and deserialization of the graph."""
 
+import os
 import uuid
-import re
+import json
+import threading
 
-from .node import Node
-from .edge import Edge
-from .helpers import fromJson, toJson, readFileContent
-from .exceptions import UnregisteredNodeClassError
+from .model import GraphModel
+from .changes import applyDelta
+from .fileio import fromJson, toJson, readFileContent, replaceFile
+from . import binary
+from .exceptions import UnregisteredNodeClassError, KnobConnectionError
 
 
 def serializeEdge(edge):
@@ -46,84 +49,456 @@ def serializeScene(scene):
     I repeat: If specific node/knob/header settings like flow, colors or
     labels have been changed, that is not (yet) stored here!
     """
-    nodes = [i for i in scene.items() if isinstance(i, Node)]
-    edges = [i for i in scene.items() if isinstance(i, Edge)]
-    data = {
-        "nodes": [serializeNode(node) for node in nodes],
-        "edges": [serializeEdge(edge) for edge in edges]
-    }
-    return data
+    return serializeModel(scene.model)
 
 
-def reconstructScene(graphWidget, sceneData):
-    """Rebuild a scene based on the serialized data.
+def serializeModel(model):
+    """Return the GraphModel as native Python datatypes, fit for json.
 
-    This reconstructs only type, position and connections right now.
+    This is what serializeScene() stores, but needs no QGraphicsItems.
     """
-    # Node classes need to be registered beforehand.
+    nodes = model.nodes()
+    uuids = {}
+    nodesData = []
+    for node in nodes:
+        uuids[node.id] = node.uuid
+        nodesData.append({
+            "class": node.cls,
+            "uuid": node.uuid,
+            "x": node.x,
+            "y": node.y,
+        })
+
+    edgesData = [{
+        "source_nodeId": uuids[edge.source],
+        "source_name": edge.sourceKnob,
+        "target_nodeId": uuids[edge.target],
+        "target_name": edge.targetKnob,
+    } for edge in model.edges()]
+
+    return {"nodes": nodesData, "edges": edgesData}
+
+
+def loadModel(sceneData):
+    """Return a new GraphModel for the serialized scene.
+
+    This does not create any QGraphicsItems. Since the scene data does
+    not contain Node sizes or complete knob tables, the records have no
+    size and only know the Knobs that are connected.
+    """
+    model = GraphModel()
+    for nodeData in sceneData["nodes"]:
+        model.addNode(nodeData["uuid"], nodeData["class"],
+                      nodeData["x"], nodeData["y"])
+
+    for edgeData in sceneData["edges"]:
+        source = model.node(edgeData["source_nodeId"])
+        target = model.node(edgeData["target_nodeId"])
+        if edgeData["source_name"] not in source.outputs:
+            source.outputs.append(edgeData["source_name"])
+        if edgeData["target_name"] not in target.inputs:
+            target.inputs.append(edgeData["target_name"])
+        if model.isConnected(source, edgeData["source_name"],
+                             target, edgeData["target_name"]):
+            continue
+        model.addEdge(source, edgeData["source_name"],
+                      target, edgeData["target_name"])
+    return model
+
+
+def getClassMap(graphWidget):
+    """Return the widget's registered Node classes by their name."""
     classMap = {}
     for cls in graphWidget.nodeClasses:
         classMap[cls.__name__] = cls
+    return classMap
 
-    # Reconstruct Nodes.
-    for nodeData in sceneData["nodes"]:
-        try:
-            cls = classMap[nodeData["class"]]
-        except KeyError as err:
-            raise UnregisteredNodeClassError(err)
 
-        node = cls()
-        node.uuid = nodeData["uuid"]  # Enforce 'original' uuid.
-        node.setPos(nodeData["x"], nodeData["y"])
+def reconstructNode(graphWidget, classMap, nodeData):
+    """Create, place and add a single Node from its serialized data."""
+    try:
+        cls = classMap[nodeData["class"]]
+    except KeyError as err:
+        raise UnregisteredNodeClassError(err)
 
-        graphWidget.addNode(node)
+    node = cls()
+    node.uuid = nodeData["uuid"]  # Enforce 'original' uuid.
+    node.setPos(nodeData["x"], nodeData["y"])
 
-    # Reconstruct their connections.
-    for edgeData in sceneData["edges"]:
-        sourceNode = graphWidget.getNodeById(edgeData["source_nodeId"])
-        sourceKnob = sourceNode.knob(edgeData["source_name"])
+    graphWidget.addNode(node)
+    return node
+
+
+def reconstructEdge(graphWidget, edgeData):
+    """Connect two existing Nodes' Knobs based on the serialized data.
+
+    Connections that are not valid (e.g. duplicates) are skipped.
+    """
+    sourceNode = graphWidget.getNodeById(edgeData["source_nodeId"])
+    sourceKnob = sourceNode.knob(edgeData["source_name"])
 
-        targetNode = graphWidget.getNodeById(edgeData["target_nodeId"])
-        targetKnob = targetNode.knob(edgeData["target_name"])
+    targetNode = graphWidget.getNodeById(edgeData["target_nodeId"])
+    targetKnob = targetNode.knob(edgeData["target_name"])
 
+    try:
         sourceKnob.connectTo(targetKnob)
+    except KnobConnectionError as err:
+        print(err)
+
+
+def reconstructScene(graphWidget, sceneData):
+    """Rebuild a scene based on the serialized data.
+
+    This reconstructs only type, position and connections right now.
 
+    Return the list of newly created Nodes.
+    """
+    # Node classes need to be registered beforehand.
+    classMap = getClassMap(graphWidget)
 
-def saveSceneToFile(sceneData, jsonFile):
-    """Store the serialized scene as .json file."""
-    with open(jsonFile, "w") as f:
-        f.write(toJson(sceneData) + "\n")
+    # Everything is committed at once, when leaving the batch.
+    with graphWidget.batchUpdates():
+        nodes = [reconstructNode(graphWidget, classMap, nodeData)
+                 for nodeData in sceneData["nodes"]]
+        for edgeData in sceneData["edges"]:
+            reconstructEdge(graphWidget, edgeData)
 
+    return nodes
 
-def _renewUUIDs(jsonString):
-    """Renew uuids in given text, by doing complete string replacements
-    with newly generated uuids.
 
-    Return the resulting text.
+def reconstructDelta(graphWidget, delta):
+    """Apply the delta (see changes.py) to the widget's current scene.
+
+    Only what changed is touched: Nodes are moved, added or removed and
+    Edges connected or disconnected as needed, everything else stays.
+    """
+    classMap = getClassMap(graphWidget)
+    model = graphWidget.scene.model
+
+    with graphWidget.batchUpdates():
+        for edgeData in delta["removed_edges"]:
+            source = model.node(edgeData["source_nodeId"])
+            target = model.node(edgeData["target_nodeId"])
+            if source is None or target is None:
+                continue
+            edge = model.findEdge(source, edgeData["source_name"],
+                                  target, edgeData["target_name"])
+            if edge is not None:
+                edge.item.destroy()
+
+        for uuid in delta["removed_nodes"]:
+            node = graphWidget.getNodeById(uuid)
+            if node is not None:
+                graphWidget.removeNode(node)
+
+        for nodeData in delta["nodes"]:
+            node = graphWidget.getNodeById(nodeData["uuid"])
+            if node is None:
+                reconstructNode(graphWidget, classMap, nodeData)
+            else:
+                node.setPos(nodeData["x"], nodeData["y"])
+
+        for edgeData in delta["edges"]:
+            source = model.node(edgeData["source_nodeId"])
+            target = model.node(edgeData["target_nodeId"])
+            if source is None or target is None:
+                continue
+            edge = model.findEdge(source, edgeData["source_name"],
+                                  target, edgeData["target_name"])
+            if edge is None:
+                reconstructEdge(graphWidget, edgeData)
+
+
+def isBinarySceneFile(filePath):
+    """Return True if the file is stored in the binary scene format."""
+    with open(filePath, "rb") as f:
+        return binary.isBinary(f.read(len(binary.MAGIC)))
+
+
+def saveSceneToFile(sceneData, filePath, binaryFormat=None):
+    """Store the serialized scene as .json or binary file.
+
+    binaryFormat: If None, the binary format is used if the file has
+        the binary.EXTENSION, .json otherwise.
+
+    Any journal of a previous version of the file is discarded.
     """
-    RE_UUID = r"(?P<uuid>\w{8}-\w{4}-\w{4}-\w{4}-\w{12})"
-    matches = re.findall(RE_UUID, jsonString)
-    uuids = list(set(matches))
-    for original in uuids:
-        replacement = str(uuid.uuid4())
-        jsonString = jsonString.replace(original, replacement)
-    return jsonString
+    if binaryFormat is None:
+        binaryFormat = filePath.lower().endswith(binary.EXTENSION)
+
+    # Wait for a running compaction, which would overwrite the file.
+    with _compactionLock, _journalLock:
+        _writeSceneFile(sceneData, filePath, binaryFormat)
+        for path in (journalPath(filePath), _compactingPath(filePath)):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _writeSceneFile(sceneData, filePath, binaryFormat):
+    """Write the file as a whole, replacing the old one only once done."""
+    tempPath = filePath + ".tmp"
+    if binaryFormat:
+        with open(tempPath, "wb") as f:
+            f.write(binary.dumps(sceneData))
+    else:
+        with open(tempPath, "w") as f:
+            f.write(toJson(sceneData) + "\n")
+    replaceFile(tempPath, filePath)
 
 
-def loadSceneFromFile(jsonFile, refreshIds=False):
-    """Read the serialized scene data from a .json file.
+# Incremental saving.
+#
+# Instead of rewriting a whole (possibly huge) scene file, changes can be
+# appended as deltas (see changes.py) to a journal next to it. Loading
+# replays the journal on top of the file, compactJournal() merges it back
+# into the file.
 
-    refreshIds: If True, ensures all uuids are renewed (on a text
-        basis), meaning they will not overwrite existing scene content.
+# Guards journal appends against a concurrent compaction.
+_journalLock = threading.Lock()
+_compactionLock = threading.Lock()
+
+
+def journalPath(filePath):
+    """Return the path of the journal belonging to the scene file."""
+    return filePath + ".journal"
+
+
+def _compactingPath(filePath):
+    """Journal entries that are currently being compacted."""
+    return journalPath(filePath) + ".compacting"
+
+
+def appendToJournal(filePath, delta):
+    """Append the delta to the scene file's journal."""
+    line = json.dumps(delta, separators=(",", ":"))
+    with _journalLock:
+        with open(journalPath(filePath), "a") as f:
+            f.write(line + "\n")
+
+
+def readJournal(filePath):
+    """Return all deltas journaled for the scene file, oldest first."""
+    deltas = []
+    with _journalLock:
+        for path in (_compactingPath(filePath), journalPath(filePath)):
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                deltas.extend(fromJson(line) for line in f if line.strip())
+    return deltas
+
+
+def journalSize(filePath):
+    """Return the size of the scene file's journal in bytes."""
+    with _journalLock:
+        paths = (_compactingPath(filePath), journalPath(filePath))
+        return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+
+def compactJournal(filePath):
+    """Merge the scene file's journal into the file itself.
+
+    This is safe to run in a background thread while further deltas are
+    appended: The current journal is set aside first, so new entries go
+    to a fresh one. Does nothing if a compaction is already running.
+    """
+    if not _compactionLock.acquire(False):
+        return
+    try:
+        journal = journalPath(filePath)
+        compacting = _compactingPath(filePath)
+        with _journalLock:
+            if os.path.exists(journal):
+                if os.path.exists(compacting):
+                    # Left over by an interrupted compaction.
+                    with open(journal) as src, open(compacting, "a") as dst:
+                        dst.write(src.read())
+                    os.remove(journal)
+                else:
+                    replaceFile(journal, compacting)
+            if not os.path.exists(compacting):
+                return
+
+        sceneData = _loadSceneFile(filePath)
+        with open(compacting) as f:
+            for line in f:
+                if line.strip():
+                    sceneData = applyDelta(sceneData, fromJson(line))
+        _writeSceneFile(sceneData, filePath, isBinarySceneFile(filePath))
+
+        # The deltas are part of the file now. Would we be interrupted
+        # before this, replaying them again is harmless.
+        with _journalLock:
+            os.remove(compacting)
+    finally:
+        _compactionLock.release()
+
+
+def iterSceneFile(filePath, chunkSize=1 << 16):
+    """Incrementally parse a scene file.
+
+    Yield a ("nodes", nodeData) or ("edges", edgeData) tuple for every
+    entry as soon as it has been read, together with the number of
+    characters consumed so far: (key, data, position).
+
+    Only a chunk of the file is held in memory at any time, so this is
+    suitable for very large files. Other top-level keys are skipped.
+
+    Binary scene files are compact and fast to read, so they are read
+    as a whole and then yielded entry by entry.
+
+    Like for .json files, the journal is not applied, see readJournal().
+    """
+    if isBinarySceneFile(filePath):
+        sceneData = _loadSceneFile(filePath)
+        total = len(sceneData["nodes"]) + len(sceneData["edges"])
+        fileSize = os.path.getsize(filePath)
+        count = 0
+        for key in ("nodes", "edges"):
+            for data in sceneData[key]:
+                count += 1
+                yield key, data, fileSize * count // total
+        return
+
+    decoder = json.JSONDecoder()
+    whitespace = " \t\n\r"
+
+    with open(filePath) as f:
+        state = {"buf": "", "pos": 0, "offset": 0, "eof": False}
+
+        def fill():
+            """Read the next chunk, dropping what has been consumed."""
+            if state["eof"]:
+                return False
+            chunk = f.read(chunkSize)
+            if not chunk:
+                state["eof"] = True
+                return False
+            consumed = state["pos"]
+            state["buf"] = state["buf"][consumed:] + chunk
+            state["offset"] += consumed
+            state["pos"] = 0
+            return True
+
+        def peek():
+            """Return the next non-whitespace character, or ''."""
+            while True:
+                buf = state["buf"]
+                pos = state["pos"]
+                while pos < len(buf) and buf[pos] in whitespace:
+                    pos += 1
+                state["pos"] = pos
+                if pos < len(buf):
+                    return buf[pos]
+                if not fill():
+                    return ""
+
+        def expect(char):
+            found = peek()
+            if found != char:
+                raise ValueError("Expected {0!r} at character {1}, got {2!r}"
+                                 .format(char, state["offset"] + state["pos"],
+                                         found))
+            state["pos"] += 1
+
+        def decode():
+            """Decode the next complete JSON value."""
+            peek()
+            while True:
+                buf = state["buf"]
+                try:
+                    value, end = decoder.raw_decode(buf, state["pos"])
+                except ValueError:
+                    if not fill():
+                        raise
+                    continue
+                # A value touching the end of the buffer (e.g. a number)
+                # may continue in the next chunk.
+                if end == len(buf) and fill():
+                    continue
+                state["pos"] = end
+                return value
+
+        def position():
+            return state["offset"] + state["pos"]
+
+        expect("{")
+        while peek() not in ("}", ""):
+            if peek() == ",":
+                state["pos"] += 1
+            key = decode()
+            expect(":")
+            if key not in ("nodes", "edges"):
+                decode()
+                continue
+
+            expect("[")
+            while peek() != "]":
+                if peek() == ",":
+                    state["pos"] += 1
+                    continue
+                if not peek():
+                    raise ValueError("Unexpected end of file.")
+                yield key, decode(), position()
+            state["pos"] += 1
+        expect("}")
+
+
+def renewIds(sceneData):
+    """Return a copy of the serialized scene with newly generated uuids.
+
+    Every Node gets a new uuid and Edges are remapped accordingly, so the
+    result can be added to a scene that already contains the original
+    Nodes. Works on any scene data, e.g. loaded files or Hold snapshots.
+    """
+    mapping = {}
+    nodes = []
+    for nodeData in sceneData["nodes"]:
+        newId = str(uuid.uuid4())
+        mapping[nodeData["uuid"]] = newId
+        nodeData = dict(nodeData)
+        nodeData["uuid"] = newId
+        nodes.append(nodeData)
+
+    edges = []
+    for edgeData in sceneData["edges"]:
+        edgeData = dict(edgeData)
+        sourceId = edgeData["source_nodeId"]
+        targetId = edgeData["target_nodeId"]
+        edgeData["source_nodeId"] = mapping.get(sourceId, sourceId)
+        edgeData["target_nodeId"] = mapping.get(targetId, targetId)
+        edges.append(edgeData)
+
+    return {"nodes": nodes, "edges": edges}
+
+
+def _loadSceneFile(filePath):
+    """Read the file as it is, without its journal."""
+    if isBinarySceneFile(filePath):
+        with open(filePath, "rb") as f:
+            return binary.loads(f.read())
+    return fromJson(readFileContent(filePath))
+
+
+def loadSceneFromFile(filePath, refreshIds=False):
+    """Read the serialized scene data from a .json or binary file.
+
+    The format is detected from the file's content. Changes saved to
+    the file's journal are applied.
+
+    refreshIds: If True, ensures all uuids are renewed (see renewIds()),
+        meaning they will not overwrite existing scene content.
         This can be used to 'merge' a file into an existing scene.
     """
-    text = readFileContent(jsonFile)
+    sceneData = _loadSceneFile(filePath)
+    for delta in readJournal(filePath):
+        sceneData = applyDelta(sceneData, delta)
+
     if refreshIds:
-        text = _renewUUIDs(text)
-    sceneData = fromJson(text)
+        sceneData = renewIds(sceneData)
     return sceneData
 
 
-def mergeSceneFromFile(jsonFile):
+def mergeSceneFromFile(filePath):
     """Like loading, but with new uuids, so it can be merged."""
-    return loadSceneFromFile(jsonFile, refreshIds=True)
+    return loadSceneFromFile(filePath, refreshIds=True)
@@ -1,11 +1,10 @@
 """Custom QGraphicsView."""
 
+import math
+
 from PySide import QtGui
 from PySide import QtCore
 
-from .node import Node
-from .edge import Edge
-
 
 CURRENT_ZOOM = 1.0
 ALTERNATE_MODE_KEY = QtCore.Qt.Key.Key_Alt
@@ -20,9 +19,18 @@ class GridView(QtGui.QGraphicsView):
         self.fillColor = QtGui.QColor(250, 250, 250)
         self.lineColor = QtGui.QColor(230, 230, 230)
 
+        self.majorLineColor = QtGui.QColor(205, 205, 205)
+
         self.xStep = 20
         self.yStep = 20
 
+        # Grid level of detail: Every n-th line is a major line. When
+        # zooming out, minor lines fade out as they get closer than a few
+        # pixels, and the grid then continues with the major lines' step.
+        self.majorLineEvery = 5
+        self.minLineSpacing = 6
+        self.fadeLineSpacing = 16
+
         self.panningMult = 2.0 * CURRENT_ZOOM
         self.panning = False
         self.zoomStep = 1.1
@@ -35,17 +43,18 @@ class GridView(QtGui.QGraphicsView):
         self.setTransformationAnchor(QtGui.QGraphicsView.AnchorUnderMouse)
 
     def nodes(self):
-        """Return all Nodes in the scene."""
-        return [i for i in self.scene().items() if isinstance(i, Node)]
+        """Return all Nodes in the scene, as known by its GraphModel."""
+        return [n.item for n in self.scene().model.nodes()]
 
     def edges(self):
-        """Return all Edges in the scene."""
-        return [i for i in self.scene().items() if isinstance(i, Edge)]
+        """Return all Edges in the scene, as known by its GraphModel."""
+        return [e.item for e in self.scene().model.edges()]
 
     def redrawEdges(self):
         """Trigger a repaint of all Edges in the scene."""
         for edge in self.edges():
             edge.updatePath()
+            edge.update()
 
     def keyPressEvent(self, event):
         """Trigger a redraw of Edges to update their color."""
@@ -98,28 +107,76 @@ class GridView(QtGui.QGraphicsView):
         global CURRENT_ZOOM
         CURRENT_ZOOM = self.transform().m11()
 
+    def _gridLevel(self, step, zoom):
+        """Return (step, alpha) of the minor lines at the given zoom.
+
+        The step grows by majorLineEvery until lines are at least
+        minLineSpacing pixels apart. Alpha fades the minor lines in
+        between minLineSpacing and fadeLineSpacing pixels.
+        """
+        while step * zoom < self.minLineSpacing:
+            step *= self.majorLineEvery
+        spacing = step * zoom
+        fadeRange = float(self.fadeLineSpacing - self.minLineSpacing)
+        alpha = min(1.0, (spacing - self.minLineSpacing) / fadeRange)
+        return step, alpha
+
+    def _gridLines(self, start, end, step):
+        """Return (minor, major) positions of grid lines between start
+        and end, aligned to the step."""
+        minor = []
+        major = []
+        first = int(math.ceil(start / step))
+        last = int(math.floor(end / step))
+        for i in range(first, last + 1):
+            if i % self.majorLineEvery:
+                minor.append(i * step)
+            else:
+                major.append(i * step)
+        return minor, major
+
     def drawBackground(self, painter, rect):
-        painter.setBrush(QtGui.QBrush(self.fillColor))
-        painter.setPen(QtGui.QPen(self.lineColor))
+        """Draw the grid for the exposed rect.
 
+        The number of lines only depends on the viewport's size, not on
+        the zoom level, see _gridLevel().
+        """
+        painter.save()
+        painter.setRenderHint(QtGui.QPainter.Antialiasing, False)
+        painter.fillRect(rect, self.fillColor)
+
+        zoom = self.transform().m11()
         top = rect.top()
         bottom = rect.bottom()
         left = rect.left()
         right = rect.right()
 
-        lines = []
-
-        currentXPos = left
-        while currentXPos <= right:
-            line = QtCore.QLine(currentXPos, top, currentXPos, bottom)
-            lines.append(line)
-            currentXPos += self.xStep
-
-        currentYPos = top
-        while currentYPos <= bottom:
-            line = QtCore.QLine(left, currentYPos, right, currentYPos)
-            lines.append(line)
-            currentYPos += self.yStep
-
-        painter.drawRect(rect)
-        painter.drawLines(lines)
+        minorLines = []
+        majorLines = []
+        xStep, xAlpha = self._gridLevel(self.xStep, zoom)
+        yStep, yAlpha = self._gridLevel(self.yStep, zoom)
+
+        minorX, majorX = self._gridLines(left, right, xStep)
+        minorY, majorY = self._gridLines(top, bottom, yStep)
+        for x in majorX:
+            majorLines.append(QtCore.QLineF(x, top, x, bottom))
+        for y in majorY:
+            majorLines.append(QtCore.QLineF(left, y, right, y))
+        if xAlpha > 0:
+            for x in minorX:
+                minorLines.append(QtCore.QLineF(x, top, x, bottom))
+        if yAlpha > 0:
+            for y in minorY:
+                minorLines.append(QtCore.QLineF(left, y, right, y))
+
+        # Cosmetic pens stay one pixel wide at any zoom level.
+        if minorLines:
+            minorColor = QtGui.QColor(self.lineColor)
+            minorColor.setAlphaF(min(xAlpha, yAlpha))
+            pen = QtGui.QPen(minorColor, 0)
+            painter.setPen(pen)
+            painter.drawLines(minorLines)
+        if majorLines:
+            painter.setPen(QtGui.QPen(self.majorLineColor, 0))
+            painter.drawLines(majorLines)
+        painter.restore()
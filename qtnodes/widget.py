@@ -5,14 +5,30 @@ Regarding the slightly weird signal connection syntax refer to:
     http://stackoverflow.com/questions/20390323/ pyqt-dynamic-generate-qmenu-action-and-connect  # noqa
 """
 import os
+import time
+import contextlib
+import threading
 
 from PySide import QtGui
 from PySide import QtCore
 
 from .node import Node
 from .view import GridView
-from .layout import autoLayout
+from .scene import GraphScene
+from .loader import SceneLoader
+from .changes import (ChangeTracker, SceneHistory, isEmptyDelta,
+                      removalDelta)
+from .layout import layoutNodes, ENGINE_NATIVE, ENGINE_FORCE
+from .layoutjob import LayoutJob
+from .layoutcache import LayoutCache
+from .evaluation import Evaluator
 from . import serializer
+from . import binary
+
+
+SAVE_FILE_FILTER = "JSON File (*.json);;Binary Scene File (*{0})".format(
+    binary.EXTENSION)
+OPEN_FILE_FILTER = "Scene File (*.json *{0})".format(binary.EXTENSION)
 
 
 class NodeGraphWidget(QtGui.QWidget):
@@ -21,13 +37,14 @@ class NodeGraphWidget(QtGui.QWidget):
     def __init__(self, parent=None):
         super(NodeGraphWidget, self).__init__(parent=parent)
 
-        self.scene = QtGui.QGraphicsScene()
+        self.scene = GraphScene()
         self.view = GridView()
         self.view.setScene(self.scene)
 
         self.view.setRenderHint(QtGui.QPainter.Antialiasing)
+        # Items report their exact bounds, so only what changed is redrawn.
         self.view.setViewportUpdateMode(
-            QtGui.QGraphicsView.FullViewportUpdate)
+            QtGui.QGraphicsView.MinimalViewportUpdate)
 
         layout = QtGui.QVBoxLayout()
         layout.addWidget(self.view)
@@ -35,9 +52,38 @@ class NodeGraphWidget(QtGui.QWidget):
 
         self.nodeClasses = []
 
-        # A cache for storing a representation of the current scene.
-        # This is used for the Hold scene / Fetch scene feature.
-        self.lastStoredSceneData = None
+        # Snapshots of the scene for the Hold scene / Fetch scene feature,
+        # stored as the changes between them.
+        self.heldScenes = SceneHistory(maxlen=10)
+        self._heldSceneCount = 0
+        # Changes since the last Hold, for the current scene and the ones
+        # that have been cleared meanwhile.
+        self._holdTracker = ChangeTracker(self.scene.model)
+        self._pendingHoldDeltas = []
+
+        # The SceneLoader currently streaming a file, if any.
+        self._sceneLoader = None
+
+        # The LayoutJob currently arranging the scene, if any.
+        self._layoutJob = None
+        # Results of previous layouts, reused for unchanged graphs.
+        self.layoutCache = LayoutCache()
+
+        # The file the scene has been loaded from or saved to last. Changes
+        # since then are tracked, so saving only needs to store those.
+        self.currentFilePath = None
+        self.changeTracker = ChangeTracker(self.scene.model)
+        self._fullSaveRequired = False
+
+        # Nodes added or (dis)connected since the last layout.
+        self.layoutTracker = ChangeTracker(self.scene.model)
+
+        # Computes the values of the Nodes, see evaluation.py.
+        self.evaluator = Evaluator(self.scene.model, self.nodeClasses)
+
+        # Compact the journal once it grows beyond this ratio of the
+        # scene file's size.
+        self.journalCompactionRatio = 0.25
 
     def clearScene(self):
         """Remove everything in the current scene.
@@ -45,9 +91,233 @@ class NodeGraphWidget(QtGui.QWidget):
         FIXME: The GC does all the work here, which is probably not the
         finest solution, but works for now.
         """
-        self.scene = QtGui.QGraphicsScene()
+        self.cancelLoading()
+        self.cancelLayout()
+        oldModel = self.scene.model
+        self.scene = GraphScene()
         self.view.setScene(self.scene)
 
+        # A new scene means the old changes are meaningless.
+        self.changeTracker.detach()
+        self.changeTracker = ChangeTracker(self.scene.model)
+        self._fullSaveRequired = True
+        self.layoutTracker.detach()
+        self.layoutTracker = ChangeTracker(self.scene.model)
+        self.evaluator.detach()
+        self.evaluator = Evaluator(self.scene.model, self.nodeClasses)
+
+        if len(self.heldScenes):
+            self._pendingHoldDeltas.append(self._holdTracker.takeDelta())
+            self._pendingHoldDeltas.append(removalDelta(oldModel))
+        self._holdTracker.detach()
+        self._holdTracker = ChangeTracker(self.scene.model)
+
+    @contextlib.contextmanager
+    def batchUpdates(self):
+        """Context for adding/connecting many items at once.
+
+        While open, the scene neither maintains its item index nor
+        recomputes Edge paths and the view does not repaint. Everything
+        is committed in one pass on exit. Batches may be nested.
+
+            with graph.batchUpdates():
+                for node in nodes:
+                    graph.addNode(node)
+        """
+        scene = self.scene
+        viewport = self.view.viewport()
+        viewport.setUpdatesEnabled(False)
+        scene.beginBatch()
+        try:
+            yield
+        finally:
+            scene.endBatch()
+            if not scene.isBatching():
+                viewport.setUpdatesEnabled(True)
+                viewport.update()
+
+    def streamSceneFromFile(self, filePath):
+        """Incrementally load the file into the current scene.
+
+        The UI stays responsive while loading and a non-modal progress
+        dialog allows to cancel, keeping what has been loaded until then.
+        """
+        self.cancelLoading()
+
+        loader = SceneLoader(self, filePath, parent=self)
+        dialog = QtGui.QProgressDialog(
+            "Loading {0}...".format(os.path.basename(filePath)),
+            "Cancel", 0, 100, self)
+        dialog.setWindowModality(QtCore.Qt.NonModal)
+        dialog.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+
+        loader.progress.connect(dialog.setValue)
+        loader.finished.connect(dialog.close)
+        loader.cancelled.connect(dialog.close)
+        loader.failed.connect(dialog.close)
+        dialog.canceled.connect(loader.cancel)
+
+        def _loaded():
+            self.currentFilePath = filePath
+            self.changeTracker.reset()
+            self._fullSaveRequired = False
+            # Take the loaded positions as they are.
+            self.layoutTracker.reset()
+
+        def _cancelled():
+            # The scene does not match the file, better not touch it.
+            self.currentFilePath = None
+
+        def _failed(err):
+            print("loading failed: {0}".format(err))
+            self.currentFilePath = None
+
+        loader.finished.connect(_loaded)
+        loader.cancelled.connect(_cancelled)
+        loader.failed.connect(_failed)
+
+        self._sceneLoader = loader
+        dialog.show()
+        loader.start()
+        return loader
+
+    def holdScene(self):
+        """Store the current state of the scene for fetchScene().
+
+        Up to heldScenes.maxlen states are kept, the oldest get dropped.
+        Only the first one is serialized as a whole, all others are
+        stored as the changes since the previous one.
+        """
+        self._heldSceneCount += 1
+        label = "{0}: {1} ({2} Nodes)".format(
+            self._heldSceneCount, time.strftime("%H:%M:%S"),
+            self.scene.model.nodeCount())
+        if not len(self.heldScenes):
+            self.heldScenes.hold(
+                label, sceneData=serializer.serializeScene(self.scene))
+        else:
+            self.heldScenes.hold(label, deltas=self._pendingHoldDeltas +
+                                 [self._holdTracker.peekDelta()])
+        self._holdTracker.reset()
+        self._pendingHoldDeltas = []
+
+    def fetchScene(self, index=-1):
+        """Restore a state stored by holdScene(), by default the last one.
+
+        Only the difference to the current scene is applied, all other
+        items and the current view stay as they are. Finding it takes
+        time in proportion to the changes since that state.
+        """
+        if not len(self.heldScenes):
+            print("scene data is empty, nothing to load")
+            return
+        pending = self._pendingHoldDeltas + [self._holdTracker.peekDelta()]
+        delta = self.heldScenes.deltaTo(self.scene.model, index, pending)
+        serializer.reconstructDelta(self, delta)
+
+    def saveScene(self, filePath=None):
+        """Save the scene to the given or else the current file.
+
+        If the scene has been loaded from or saved to that file before,
+        only the changes since then are appended to the file's journal
+        (see serializer.appendToJournal()), so saving is fast even for
+        huge scenes. The journal is compacted into the file in a
+        background thread every once in a while.
+        """
+        incremental = filePath in (None, self.currentFilePath)
+        filePath = filePath or self.currentFilePath
+        if not filePath:
+            raise ValueError("No file to save the scene to.")
+
+        if not incremental or self._fullSaveRequired:
+            sceneData = serializer.serializeScene(self.scene)
+            serializer.saveSceneToFile(sceneData, filePath)
+        else:
+            delta = self.changeTracker.takeDelta()
+            if not isEmptyDelta(delta):
+                serializer.appendToJournal(filePath, delta)
+            fileSize = os.path.getsize(filePath)
+            journalSize = serializer.journalSize(filePath)
+            if journalSize > fileSize * self.journalCompactionRatio:
+                thread = threading.Thread(target=serializer.compactJournal,
+                                          args=(filePath,))
+                thread.daemon = True
+                thread.start()
+
+        self.currentFilePath = filePath
+        self.changeTracker.reset()
+        self._fullSaveRequired = False
+
+    def cancelLoading(self):
+        """Stop a running streamSceneFromFile(), if any."""
+        if self._sceneLoader:
+            self._sceneLoader.cancel()
+            self._sceneLoader.deleteLater()
+            self._sceneLoader = None
+
+    def mergeScene(self, sceneData):
+        """Add a copy of the serialized scene to the current scene.
+
+        The copy gets new uuids, so this also works for data that stems
+        from the current scene itself (e.g. a Hold snapshot). The merged
+        Nodes get selected, so they can be moved right away.
+        """
+        self.scene.clearSelection()
+        mergedNodes = serializer.reconstructScene(
+            self, serializer.renewIds(sceneData))
+        for node in mergedNodes:
+            node.setSelected(True)
+        return mergedNodes
+
+    def autoLayoutScene(self, engine=ENGINE_NATIVE):
+        """Arrange all Nodes, computing the layout in the background.
+
+        A non-modal progress dialog allows to cancel before the Nodes
+        are moved.
+        """
+        self.cancelLayout()
+
+        job = LayoutJob(self, engine=engine, parent=self)
+        dialog = QtGui.QProgressDialog("Computing layout...",
+                                       "Cancel", 0, 100, self)
+        dialog.setWindowModality(QtCore.Qt.NonModal)
+        dialog.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+        # Do not bother for layouts that are done right away.
+        dialog.setMinimumDuration(500)
+
+        job.progress.connect(dialog.setValue)
+        job.finished.connect(dialog.close)
+        job.cancelled.connect(dialog.close)
+        job.failed.connect(dialog.close)
+        job.failed.connect(self._layoutFailed)
+        dialog.canceled.connect(job.cancel)
+        job.finished.connect(self.layoutTracker.reset)
+
+        self._layoutJob = job
+        job.start()
+
+    def _layoutFailed(self, err):
+        print("layout failed: {0}".format(err))
+
+    def cancelLayout(self):
+        """Stop a running autoLayoutScene(), if any."""
+        if self._layoutJob:
+            self._layoutJob.cancel()
+            self._layoutJob.deleteLater()
+            self._layoutJob = None
+
+    def layoutSelectedNodes(self):
+        """Arrange the selected Nodes, leaving all others in place."""
+        layoutNodes(self.scene, [i.uuid for i in self.scene.selectedItems()
+                                 if isinstance(i, Node)])
+        self.layoutTracker.reset()
+
+    def layoutChangedNodes(self):
+        """Arrange the Nodes added or (dis)connected since the last
+        layout, leaving all others in place."""
+        layoutNodes(self.scene, self.layoutTracker.touchedNodes())
+        self.layoutTracker.reset()
+
     def keyPressEvent(self, event):
         """React on various keys regarding Nodes."""
 
@@ -56,7 +326,7 @@ class NodeGraphWidget(QtGui.QWidget):
             selectedNodes = [i for i in self.scene.selectedItems()
                              if isinstance(i, Node)]
             for node in selectedNodes:
-                node.destroy()
+                self.removeNode(node)
 
         super(NodeGraphWidget, self).keyPressEvent(event)
 
@@ -67,13 +337,21 @@ class NodeGraphWidget(QtGui.QWidget):
         def _saveSceneAs():
             filePath, _ = QtGui.QFileDialog.getSaveFileName(
                 self,
-                "Save Scene to JSON",
+                "Save Scene to File",
                 os.path.join(QtCore.QDir.currentPath(), "scene.json"),
-                "JSON File (*.json)"
+                SAVE_FILE_FILTER
             )
             if filePath:
-                sceneData = serializer.serializeScene(self.scene)
-                serializer.saveSceneToFile(sceneData, filePath)
+                self.saveScene(filePath)
+
+        def _saveScene():
+            if self.currentFilePath:
+                self.saveScene()
+            else:
+                _saveSceneAs()
+
+        saveAction = subMenu.addAction("Save")
+        saveAction.triggered.connect(_saveScene)
 
         saveToAction = subMenu.addAction("Save As...")
         saveToAction.triggered.connect(_saveSceneAs)
@@ -81,15 +359,13 @@ class NodeGraphWidget(QtGui.QWidget):
         def _loadSceneFrom():
             filePath, _ = QtGui.QFileDialog.getOpenFileName(
                 self,
-                "Open Scene JSON File",
+                "Open Scene File",
                 os.path.join(QtCore.QDir.currentPath(), "scene.json"),
-                "JSON File (*.json)"
+                OPEN_FILE_FILTER
             )
             if filePath:
-                sceneData = serializer.loadSceneFromFile(filePath)
-                if sceneData:
-                    self.clearScene()
-                    serializer.reconstructScene(self, sceneData)
+                self.clearScene()
+                self.streamSceneFromFile(filePath)
 
         loadFromAction = subMenu.addAction("Open File...")
         loadFromAction.triggered.connect(_loadSceneFrom)
@@ -97,20 +373,14 @@ class NodeGraphWidget(QtGui.QWidget):
         def _mergeSceneFrom():
             filePath, _ = QtGui.QFileDialog.getOpenFileName(
                 self,
-                "Open Scene JSON File",
+                "Open Scene File",
                 os.path.join(QtCore.QDir.currentPath(), "scene.json"),
-                "JSON File (*.json)"
+                OPEN_FILE_FILTER
             )
             if filePath:
-                sceneData = serializer.mergeSceneFromFile(filePath)
+                sceneData = serializer.loadSceneFromFile(filePath)
                 if sceneData:
-                    # Select only new nodes so they can be moved.
-                    oldNodes = set(self.view.nodes())
-                    serializer.reconstructScene(self, sceneData)
-                    allNodes = set(self.view.nodes())
-                    mergedNodes = allNodes - oldNodes
-                    for node in mergedNodes:
-                        node.setSelected(True)
+                    self.mergeScene(sceneData)
 
         mergeFromAction = subMenu.addAction("Merge File...")
         mergeFromAction.triggered.connect(_mergeSceneFrom)
@@ -118,24 +388,26 @@ class NodeGraphWidget(QtGui.QWidget):
         subMenu.addSeparator()
 
         def _storeCurrentScene():
-            self.lastStoredSceneData = serializer.serializeScene(self.scene)
+            self.holdScene()
             QtGui.QMessageBox.information(self, "Hold",
                                           "Scene state holded.")
 
         holdAction = subMenu.addAction("Hold")
         holdAction.triggered.connect(_storeCurrentScene)
 
-        def _loadLastStoredScene():
-            if not self.lastStoredSceneData:
-                print("scene data is empty, nothing to load")
-                return
-            self.clearScene()
-            serializer.reconstructScene(self, self.lastStoredSceneData)
+        def _loadStoredScene(index):
+            self.fetchScene(index)
             QtGui.QMessageBox.information(self, "Fetch",
                                           "Scene state fetched.")
 
-        fetchAction = subMenu.addAction("Fetch")
-        fetchAction.triggered.connect(_loadLastStoredScene)
+        fetchMenu = subMenu.addMenu("Fetch")
+        labels = self.heldScenes.labels()
+        fetchMenu.setEnabled(bool(labels))
+        for index in reversed(range(len(labels))):
+            label = labels[index]
+            action = fetchMenu.addAction(label)
+            action.triggered[()].connect(
+                lambda index=index: _loadStoredScene(index))
 
         subMenu.addSeparator()
 
@@ -144,12 +416,21 @@ class NodeGraphWidget(QtGui.QWidget):
 
         subMenu.addSeparator()
 
-        def _layoutScene():
-            autoLayout(self.scene)
-            self.view.redrawEdges()
-
         layoutSceneAction = subMenu.addAction("Auto Layout")
-        layoutSceneAction.triggered.connect(_layoutScene)
+        layoutSceneAction.triggered[()].connect(self.autoLayoutScene)
+
+        forceLayoutAction = subMenu.addAction("Auto Layout (Force-Directed)")
+        forceLayoutAction.triggered[()].connect(
+            lambda: self.autoLayoutScene(engine=ENGINE_FORCE))
+
+        layoutSelectedAction = subMenu.addAction("Layout Selected")
+        layoutSelectedAction.triggered.connect(self.layoutSelectedNodes)
+        layoutSelectedAction.setEnabled(bool(self.scene.selectedItems()))
+
+        layoutChangedAction = subMenu.addAction("Layout Changed")
+        layoutChangedAction.triggered.connect(self.layoutChangedNodes)
+        layoutChangedAction.setEnabled(
+            bool(self.layoutTracker.touchedNodes()))
 
     def addNodesMenuActions(self, menu):
         subMenu = menu.addMenu("Nodes")
@@ -193,18 +474,25 @@ class NodeGraphWidget(QtGui.QWidget):
             self.nodeClasses.remove(cls)
 
     def addNode(self, node):
-        """Add a Node to the current scene.
+        """Add a Node to the current scene and its GraphModel.
 
-        This is only necessary when the scene has not been passed on
-        creation, e.g. when you create a Node programmatically.
+        Always add Nodes through here (even if the scene has been passed
+        on creation), otherwise the model may not know about them.
         """
-        if node not in self.scene.items():
+        if node.scene() is not self.scene:
             self.scene.addItem(node)
+        node.register()
+
+    def removeNode(self, node):
+        """Destroy the given Node, which also removes it from the model."""
+        node.destroy()
 
     def getNodeById(self, uuid):
-        """Return Node that matches the given uuid string."""
-        nodes = [i for i in self.scene.items() if isinstance(i, Node)]
-        for node in nodes:
-            if node.uuid == uuid:
-                return node
-        return None
+        """Return Node that matches the given uuid string.
+
+        The lookup uses the uuid index of the scene's GraphModel.
+        """
+        record = self.scene.model.node(uuid)
+        if record is None:
+            return None
+        return record.item
@@ -0,0 +1,70 @@
+"""Tests for the held scene history."""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from qtnodes.changes import (SceneHistory, applyDelta, emptyDelta,  # noqa
+                             isEmptyDelta)
+from qtnodes.serializer import loadModel  # noqa
+
+
+def nodeData(uuid, x=0, y=0):
+    return {"uuid": uuid, "class": "Node", "x": x, "y": y}
+
+
+def edgeData(source, target):
+    return {"source_nodeId": source, "source_name": "out",
+            "target_nodeId": target, "target_name": "in"}
+
+
+def delta(**changes):
+    result = emptyDelta()
+    result.update(changes)
+    return result
+
+
+# A Node with only an Edge from its output to its own input.
+LOOP = edgeData("a", "a")
+SCENE = {"nodes": [nodeData("a"), nodeData("b", 100)],
+         "edges": [LOOP]}
+
+
+class SceneHistoryTest(unittest.TestCase):
+
+    def testRebaseRemovedLoop(self):
+        history = SceneHistory(maxlen=1)
+        history.hold("first", SCENE)
+        change = delta(removed_edges=[LOOP])
+        history.hold("second", deltas=[change])
+        self.assertEqual(history.labels(), ["second"])
+
+        model = loadModel(applyDelta(SCENE, change))
+        self.assertTrue(isEmptyDelta(history.deltaTo(model)))
+
+    def testRebaseRemovedNodeWithLoop(self):
+        history = SceneHistory(maxlen=1)
+        history.hold("first", SCENE)
+        change = delta(removed_nodes=["a"])
+        history.hold("second", deltas=[change])
+
+        model = loadModel(applyDelta(SCENE, change))
+        self.assertTrue(isEmptyDelta(history.deltaTo(model)))
+
+    def testRestoreLoop(self):
+        history = SceneHistory()
+        history.hold("first", SCENE)
+        change = delta(removed_edges=[LOOP])
+        history.hold("second", deltas=[change])
+
+        model = loadModel(applyDelta(SCENE, change))
+        restore = history.deltaTo(model, 0)
+        self.assertEqual(restore["edges"], [LOOP])
+        self.assertEqual(restore["removed_edges"], [])
+        self.assertTrue(isEmptyDelta(history.deltaTo(model)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""Tests for the force-directed layout."""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from qtnodes.model import GraphModel  # noqa
+from qtnodes.layout import LayoutGraph  # noqa
+from qtnodes import forcelayout  # noqa
+
+
+def buildGraph(numNodes, edges=()):
+    model = GraphModel()
+    nodes = [model.addNode("n{0}".format(i), "Node", w=100, h=50,
+                           inputs=["in"], outputs=["out"])
+             for i in range(numNodes)]
+    for source, target in edges:
+        model.addEdge(nodes[source], "out", nodes[target], "in")
+    return LayoutGraph(model)
+
+
+def overlaps(graph, positions):
+    """Return the number of Nodes whose rectangles overlap."""
+    count = 0
+    for i, ((x0, y0), (w0, h0)) in enumerate(zip(positions, graph.sizes)):
+        for (x1, y1), (w1, h1) in zip(positions[i + 1:], graph.sizes[i + 1:]):
+            if x0 < x1 + w1 and x1 < x0 + w0 and y0 < y1 + h1 and y1 < y0 + h0:
+                count += 1
+    return count
+
+
+@unittest.skipIf(forcelayout.numpy is None, "needs numpy")
+class ForceLayoutTest(unittest.TestCase):
+
+    def testEmpty(self):
+        self.assertEqual(forcelayout.forceLayout(buildGraph(0)), [])
+
+    def testSingleNode(self):
+        self.assertEqual(forcelayout.forceLayout(buildGraph(1)), [(0.0, 0.0)])
+
+    def testWithoutEdges(self):
+        for numNodes in (2, 5, 39):
+            graph = buildGraph(numNodes)
+            positions = forcelayout.forceLayout(graph)
+            self.assertEqual(len(positions), numNodes)
+            self.assertEqual(overlaps(graph, positions), 0)
+
+    def testConnected(self):
+        edges = [(i, (i * 7 + 3) % 60) for i in range(60)]
+        graph = buildGraph(60, edges)
+        positions = forcelayout.forceLayout(graph)
+        self.assertEqual(overlaps(graph, positions), 0)
+        # The same every time.
+        self.assertEqual(forcelayout.forceLayout(graph), positions)
+
+
+if __name__ == "__main__":
+    unittest.main()
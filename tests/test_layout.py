@@ -0,0 +1,79 @@
+"""Tests for computing layouts through the engines."""
+
+import os
+import sys
+import unittest
+
+try:
+    from shutil import which
+except ImportError:  # Python 2.
+    from distutils.spawn import find_executable as which
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from qtnodes.model import GraphModel  # noqa
+from qtnodes import layout  # noqa
+from qtnodes import forcelayout  # noqa
+
+try:
+    import pydot
+except ImportError:
+    pydot = None
+
+
+class DictCache(object):
+    """Keeps the layouts in memory, like a LayoutCache on disk."""
+
+    def __init__(self):
+        self.layouts = {}
+        self.hits = 0
+
+    def get(self, key):
+        positions = self.layouts.get(key)
+        if positions is not None:
+            self.hits += 1
+        return positions
+
+    def put(self, key, positions):
+        self.layouts[key] = dict(positions)
+
+
+def buildGraph():
+    model = GraphModel()
+    nodes = [model.addNode("n{0}".format(i), "Node", w=100, h=50,
+                           inputs=["in"], outputs=["out"])
+             for i in range(8)]
+    for i in range(1, 8):
+        model.addEdge(nodes[(i - 1) // 2], "out", nodes[i], "in")
+    return layout.LayoutGraph(model)
+
+
+class ComputeLayoutTest(unittest.TestCase):
+
+    def checkEngine(self, engine):
+        graph = buildGraph()
+        cache = DictCache()
+        positions = layout.computeLayout(graph, engine, cache=cache)
+        self.assertEqual(len(positions), len(graph.uuids))
+        self.assertEqual(len(cache.layouts), 1)
+        self.assertEqual(cache.hits, 0)
+
+        cached = layout.computeLayout(graph, engine, cache=cache)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cached, positions)
+
+    def testNative(self):
+        self.checkEngine(layout.ENGINE_NATIVE)
+
+    @unittest.skipIf(forcelayout.numpy is None, "needs numpy")
+    def testForce(self):
+        self.checkEngine(layout.ENGINE_FORCE)
+
+    @unittest.skipIf(pydot is None or not which("dot"),
+                     "needs pydot and graphviz")
+    def testDot(self):
+        self.checkEngine(layout.ENGINE_DOT)
+
+
+if __name__ == "__main__":
+    unittest.main()